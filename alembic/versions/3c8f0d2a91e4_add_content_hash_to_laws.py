@@ -0,0 +1,24 @@
+"""add content hash to laws
+
+Revision ID: 3c8f0d2a91e4
+Revises: eaf7308473ab
+Create Date: 2026-10-18 09:12:44.218305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8f0d2a91e4'
+down_revision = 'eaf7308473ab'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('laws', sa.Column('content_hash', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('laws', 'content_hash')
@@ -0,0 +1,40 @@
+"""make law slugs unique
+
+Revision ID: 5e2a7c41d9b3
+Revises: 7d41c9e0b2f5
+Create Date: 2026-10-18 17:41:08.306512
+
+"""
+from alembic import op
+import sqlalchemy as sa  # noqa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2a7c41d9b3'
+down_revision = '7d41c9e0b2f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Resolve remaining conflicts the way gesetze_im_internet._fixup_slug_duplicates does, as of this revision.
+    op.execute("""
+        UPDATE laws SET slug = coalesce((
+            SELECT o.new_slug
+            FROM (VALUES
+                ('aeg', 'aeg_1994', 'aeg'), ('aeg', 'aeg', 'aeg_2'),
+                ('afrg', 'altfrg', 'afrg'), ('afrg', 'afrg', 'afrg_2'),
+                ('gbv', 'gbv_2011', 'gbv'),
+                ('stvo', 'stvo_2013', 'stvo')
+            ) AS o(slug, gii_slug, new_slug)
+            WHERE o.slug = laws.slug AND o.gii_slug = laws.gii_slug
+        ), gii_slug)
+        WHERE slug IN (SELECT slug FROM laws GROUP BY slug HAVING count(*) > 1)
+    """)
+    op.drop_index("ix_laws_slug", table_name="laws")
+    op.create_unique_constraint("laws_slug_key", "laws", ["slug"], deferrable=True, initially="DEFERRED")
+
+
+def downgrade():
+    op.drop_constraint("laws_slug_key", "laws", type_="unique")
+    op.create_index("ix_laws_slug", "laws", ["slug"], unique=False)
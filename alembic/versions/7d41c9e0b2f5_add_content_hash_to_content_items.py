@@ -0,0 +1,24 @@
+"""add content hash to content items
+
+Revision ID: 7d41c9e0b2f5
+Revises: 3c8f0d2a91e4
+Create Date: 2026-10-18 14:03:27.519824
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d41c9e0b2f5'
+down_revision = '3c8f0d2a91e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('content_items', sa.Column('content_hash', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('content_items', 'content_hash')
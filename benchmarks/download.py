@@ -0,0 +1,38 @@
+"""
+Benchmark law downloads (cold cache) and update checks (warm cache) against a local stand-in for gesetze-im-internet.de.
+
+    python -m benchmarks.download --laws 500 --latency 0.05 --concurrency 1 8 16
+"""
+import argparse
+import tempfile
+import time
+
+from gadi import gesetze_im_internet
+from gadi.gesetze_im_internet.download import LocalPathLocation
+from tests.utils import FakeGii, zip_fixture
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--laws", type=int, default=200, help="Number of laws to serve")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated server latency in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    archive = zip_fixture("jfdg")
+    fake = FakeGii({f"law_{i}": (archive, 1600000000) for i in range(args.laws)}, latency=args.latency)
+
+    with fake.serve():
+        for concurrency in args.concurrency:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                location = LocalPathLocation(tmp_dir)
+                # First run downloads everything, second run only checks for updates.
+                for run in ["cold", "warm"]:
+                    start = time.perf_counter()
+                    gesetze_im_internet.download_laws(location, concurrency=concurrency, toc_url=fake.toc_url)
+                    elapsed = time.perf_counter() - start
+                    print(f"{run} concurrency={concurrency:<3} {elapsed:7.2f}s  ({args.laws / elapsed:.0f} laws/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark parsing of a single large law, built by repeating the body norms of a fixture law.
+Each run happens in a fresh process, so peak memory is reported per run.
+
+    python -m benchmarks.parsing --norms 5000 --repeat 3 --mode full streaming
+"""
+import argparse
+import copy
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from lxml import etree
+
+from gadi.gesetze_im_internet.parsing import parse_law, parse_law_streaming
+from tests.utils import xml_fixtures_dir
+
+PARSE_FUNCTIONS = {"full": parse_law, "streaming": parse_law_streaming}
+
+
+def synthetic_law(fixture_path, norm_count, out_path):
+    doc = etree.parse(fixture_path)
+    root = doc.getroot()
+    header_norm, *body_norms = root.findall("norm")
+    for norm in body_norms:
+        root.remove(norm)
+    for i in range(norm_count):
+        norm = copy.deepcopy(body_norms[i % len(body_norms)])
+        norm.set("doknr", f"{norm.get('doknr')}-{i}")
+        root.append(norm)
+    doc.write(out_path, encoding="utf-8", xml_declaration=True)
+
+
+def _timed_parse(mode, xml_path):
+    start = time.perf_counter()
+    law = PARSE_FUNCTIONS[mode](xml_path)
+    item_count = sum(1 for _ in law["contents"])
+    elapsed = time.perf_counter() - start
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return item_count, elapsed, peak_rss_mb
+
+
+def _in_fresh_process(fn, *args):
+    # Peak RSS carries over into children on Linux, so keep the parent small
+    # and do all the work in fresh processes.
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(fn, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--norms", type=int, default=5000, help="Number of body norms (BGB has about 3000)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mode", nargs="+", choices=PARSE_FUNCTIONS, default=list(PARSE_FUNCTIONS))
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix=".xml") as xml_file:
+        _in_fresh_process(synthetic_law, f"{xml_fixtures_dir}/estg/BJNR010050934.xml", args.norms, xml_file.name)
+        print(f"{args.norms} norms, {os.path.getsize(xml_file.name) / 1e6:.1f} MB")
+
+        for mode in args.mode:
+            for run in range(args.repeat):
+                item_count, elapsed, peak_rss_mb = _in_fresh_process(_timed_parse, mode, xml_file.name)
+                print(
+                    f"{mode:<9} run {run}  {elapsed:7.2f}s  ({item_count / elapsed:.0f} norms/s)"
+                    f"  peak RSS {peak_rss_mb:.0f} MB"
+                )
+
+
+if __name__ == "__main__":
+    main()
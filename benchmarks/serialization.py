@@ -0,0 +1,65 @@
+"""
+Benchmark serializing laws for the JSON export: through the pydantic models, as
+the export used to, or through the trusted fast path (see
+api_schemas.law_dict_from_orm_model). No DB needed, laws are built from fixtures.
+
+    python -m benchmarks.serialization --repeat 5 --mode models fast
+"""
+import argparse
+import json
+import time
+
+from gadi import api_schemas
+from tests.utils import load_law_from_fixture
+
+FIXTURE_SLUGS = ["alg", "estg", "ifsg", "jfdg", "skaufg"]
+
+
+def _serialize_with_models(law):
+    law_api_model = api_schemas.LawAllFields.from_orm_model(law, include_contents=True)
+    return api_schemas.LawResponse(data=law_api_model).json(indent=2), json.dumps(law_api_model.dict(), indent=2)
+
+
+def _serialize_fast(law):
+    return json.dumps(api_schemas.law_dict_from_orm_model(law, include_contents=True), indent=2)
+
+
+def _to_dicts_with_models(law):
+    return api_schemas.LawAllFields.from_orm_model(law, include_contents=True).dict()
+
+
+def _to_dicts_fast(law):
+    return api_schemas.law_dict_from_orm_model(law, include_contents=True)
+
+
+SERIALIZE_FUNCTIONS = {
+    # Everything the export does per law: its own file and its part of the bulk file
+    "models": _serialize_with_models,
+    "fast": _serialize_fast,
+    # Only building the dicts, without JSON encoding
+    "models-dict": _to_dicts_with_models,
+    "fast-dict": _to_dicts_fast,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mode", nargs="+", choices=SERIALIZE_FUNCTIONS, default=list(SERIALIZE_FUNCTIONS))
+    args = parser.parse_args()
+
+    laws = [load_law_from_fixture(slug) for slug in FIXTURE_SLUGS]
+    item_count = sum(len(law.contents) for law in laws)
+    print(f"{len(laws)} laws, {item_count} content items")
+
+    for mode in args.mode:
+        for run in range(args.repeat):
+            start = time.perf_counter()
+            for law in laws:
+                SERIALIZE_FUNCTIONS[mode](law)
+            elapsed = time.perf_counter() - start
+            print(f"{mode:<11} run {run}  {elapsed:7.3f}s  ({item_count / elapsed:.0f} items/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -267,3 +267,46 @@ class LawResponse(BaseModel):
     def from_orm_model(cls, law):
         return cls(data=LawAllFields.from_orm_model(law))
 
+
+_CONTENT_ITEM_MODELS = {
+    "article": ArticleAllFields,
+    "heading": HeadingAllFields,
+    "heading_article": HeadingArticleAllFields,
+}
+_CONTENT_ITEM_TYPES = {item_type: model.__fields__["type"].default for item_type, model in _CONTENT_ITEM_MODELS.items()}
+_CONTENT_ITEM_FIELDS = {item_type: list(model.__fields__) for item_type, model in _CONTENT_ITEM_MODELS.items()}
+
+
+def _select_fields(attrs, model):
+    """attrs in the order of the model's fields, as pydantic's .dict() would return them."""
+    return {field: attrs[field] for field in model.__fields__}
+
+
+def content_item_dict_from_orm_model(item):
+    """Same as ContentItemAllFields.from_orm_model(item).dict(), without building and validating a model."""
+    parent = item.parent
+    attrs = {
+        "type": _CONTENT_ITEM_TYPES[item.item_type],
+        "id": item.doknr,
+        "name": item.name,
+        "title": item.title,
+        "parent": parent and {"type": _CONTENT_ITEM_TYPES[parent.item_type], "id": parent.doknr},
+        "body": item.body,
+        "footnotes": item.footnotes,
+        "documentaryFootnotes": item.documentary_footnotes,
+    }
+    return {field: attrs[field] for field in _CONTENT_ITEM_FIELDS[item.item_type]}
+
+
+def law_dict_from_orm_model(law, include_contents=False):
+    """
+    Same as LawAllFields.from_orm_model(law, include_contents).dict(), without
+    building and validating models. Only meant for laws from our own DB, whose
+    fields the parser already guarantees.
+    """
+    attrs = LawAllFields._attrs_dict_from_law(law)
+    attrs["publicationInfo"] = [_select_fields(info, PublicationInfoItem) for info in attrs["publicationInfo"]]
+    attrs["statusInfo"] = [_select_fields(info, StatusInfoItem) for info in attrs["statusInfo"]]
+    attrs["notes"] = _select_fields(attrs["notes"], TextContent)
+    attrs["contents"] = [content_item_dict_from_orm_model(item) for item in law.contents] if include_contents else None
+    return _select_fields(attrs, LawAllFields)
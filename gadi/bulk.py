@@ -0,0 +1,227 @@
+"""
+Bulk writes with PostgreSQL's COPY, bypassing the ORM's unit of work.
+
+IDs are reserved from the tables' sequences up front, so parent_id and law_id
+can be filled in before anything is sent, and each table is loaded with a
+single COPY per batch of laws. Updated laws can instead be written
+incrementally, touching only the content items that changed.
+"""
+import hashlib
+import io
+import itertools
+import json
+
+from psycopg2.extras import execute_values
+
+from .models import Attachment, ContentItem, Law, slugify
+
+LAW_COLUMNS = [
+    "id", "doknr", "slug", "gii_slug", "abbreviation", "extra_abbreviations", "first_published", "source_timestamp",
+    "title_long", "title_short", "publication_info", "status_info", "notes_body", "notes_footnotes",
+    "notes_documentary_footnotes", "content_hash",
+]
+CONTENT_ITEM_COLUMNS = [
+    "id", "doknr", "item_type", "name", "title", "body", "footnotes", "documentary_footnotes", "law_id", "parent_id",
+    "order", "content_hash",
+]
+HASHED_CONTENT_ITEM_FIELDS = ["doknr", "item_type", "name", "title", "body", "footnotes", "documentary_footnotes"]
+ATTACHMENT_COLUMNS = ["law_id", "name", "data_uri"]
+
+
+def _copy_text(value):
+    """A value in COPY's text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, int):
+        return str(value)
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _array_literal(strings):
+    elements = ('"' + string.replace("\\", "\\\\").replace('"', '\\"') + '"' for string in strings)
+    return "{" + ",".join(elements) + "}"
+
+
+def _law_row(law_id, gii_slug, law_dict):
+    return [
+        law_id,
+        law_dict["doknr"],
+        slugify(law_dict["abbreviation"]),
+        gii_slug,
+        law_dict["abbreviation"],
+        _array_literal(law_dict["extra_abbreviations"]),
+        law_dict["first_published"],
+        law_dict["source_timestamp"],
+        law_dict["title_long"],
+        law_dict["title_short"],
+        json.dumps(law_dict["publication_info"]),
+        json.dumps(law_dict["status_info"]),
+        law_dict["notes_body"],
+        law_dict["notes_footnotes"],
+        law_dict["notes_documentary_footnotes"],
+        law_dict.get("content_hash"),
+    ]
+
+
+def content_item_hash(record):
+    """Hash of a content item's own fields. Its position (parent and order) is not included."""
+    fields = [getattr(record, field) for field in HASHED_CONTENT_ITEM_FIELDS]
+    return hashlib.sha256(json.dumps(fields).encode("utf-8")).hexdigest()
+
+
+def _content_item_row(law_id, item_id, parent_id, order, record, item_hash):
+    return [
+        item_id,
+        record.doknr,
+        record.item_type,
+        record.name,
+        record.title,
+        record.body,
+        record.footnotes,
+        record.documentary_footnotes,
+        law_id,
+        parent_id,
+        order,
+        item_hash,
+    ]
+
+
+def _content_item_rows(law_id, content_item_ids, records):
+    for order, (item_id, record) in enumerate(zip(content_item_ids, records)):
+        parent_id = None if record.parent_index is None else content_item_ids[record.parent_index]
+        yield _content_item_row(law_id, item_id, parent_id, order, record, content_item_hash(record))
+
+
+def reserve_ids(cursor, table_name, count):
+    """Draw `count` IDs from the sequence of the table's id column."""
+    if count == 0:
+        return []
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)", (table_name, count)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def copy_rows(cursor, table_name, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_text(value) for value in row))
+        buffer.write("\n")
+    if buffer.tell() == 0:
+        return
+
+    buffer.seek(0)
+    quoted_columns = ", ".join(f'"{column}"' for column in columns)
+    cursor.copy_expert(f"COPY {table_name} ({quoted_columns}) FROM STDIN", buffer)
+
+
+def insert_laws(session, law_dicts_by_gii_slug):
+    """
+    Insert parsed laws (see gesetze_im_internet.load_law_dict) with their content
+    items and attachments, in the session's current transaction. Any previous
+    versions of the laws need to be deleted beforehand.
+
+    :return: The new law IDs, in the order of law_dicts_by_gii_slug.
+    """
+    laws = list(law_dicts_by_gii_slug.items())
+    cursor = session.connection().connection.cursor()
+    try:
+        law_ids = reserve_ids(cursor, Law.__tablename__, len(laws))
+        content_item_ids = iter(reserve_ids(
+            cursor, ContentItem.__tablename__, sum(len(law_dict["contents"]) for _, law_dict in laws)
+        ))
+
+        law_rows = []
+        content_item_rows = []
+        attachment_rows = []
+        for law_id, (gii_slug, law_dict) in zip(law_ids, laws):
+            law_rows.append(_law_row(law_id, gii_slug, law_dict))
+            records = law_dict["contents"]
+            item_ids = list(itertools.islice(content_item_ids, len(records)))
+            content_item_rows.extend(_content_item_rows(law_id, item_ids, records))
+            attachment_rows.extend([law_id, name, data_uri] for name, data_uri in law_dict["attachments"].items())
+
+        copy_rows(cursor, Law.__tablename__, LAW_COLUMNS, law_rows)
+        copy_rows(cursor, ContentItem.__tablename__, CONTENT_ITEM_COLUMNS, content_item_rows)
+        copy_rows(cursor, Attachment.__tablename__, ATTACHMENT_COLUMNS, attachment_rows)
+    finally:
+        cursor.close()
+
+    return law_ids
+
+
+def _update_rows(cursor, table_name, columns, rows, casts=None):
+    """UPDATE rows (whose first column is the id) in a single statement."""
+    if not rows:
+        return
+    casts = casts or {}
+    assignments = ", ".join(f'"{column}" = v."{column}"' for column in columns[1:])
+    template = "(" + ", ".join(f"%s::{casts[column]}" if column in casts else "%s" for column in columns) + ")"
+    value_columns = ", ".join(f'"{column}"' for column in columns)
+    execute_values(
+        cursor,
+        f"UPDATE {table_name} AS t SET {assignments} FROM (VALUES %s) AS v({value_columns}) WHERE t.id = v.id",
+        rows,
+        template=template,
+        page_size=1000,
+    )
+
+
+def update_law(session, law_id, gii_slug, law_dict):
+    """
+    Write a new version of an existing law in place, keeping its ID. Content
+    items are matched by doknr and compared by content_item_hash, so only new,
+    changed, moved and removed items are written.
+
+    :return: Counts of inserted, updated, moved (parent or order only) and deleted content items.
+    """
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(
+            'SELECT doknr, id, content_hash, parent_id, "order" FROM content_items WHERE law_id = %s', (law_id,)
+        )
+        stored_items = {row[0]: row[1:] for row in cursor.fetchall()}
+
+        records = law_dict["contents"]
+        new_ids = iter(reserve_ids(
+            cursor, ContentItem.__tablename__, sum(1 for record in records if record.doknr not in stored_items)
+        ))
+        item_ids = [
+            stored_items[record.doknr][0] if record.doknr in stored_items else next(new_ids) for record in records
+        ]
+
+        inserted, updated, moved = [], [], []
+        for order, (item_id, record) in enumerate(zip(item_ids, records)):
+            parent_id = None if record.parent_index is None else item_ids[record.parent_index]
+            item_hash = content_item_hash(record)
+            stored_item = stored_items.get(record.doknr)
+            if stored_item is None:
+                inserted.append(_content_item_row(law_id, item_id, parent_id, order, record, item_hash))
+            elif stored_item[1] != item_hash:
+                updated.append(_content_item_row(law_id, item_id, parent_id, order, record, item_hash))
+            elif stored_item[2:] != (parent_id, order):
+                moved.append([item_id, parent_id, order])
+
+        current_doknrs = {record.doknr for record in records}
+        deleted_ids = [stored[0] for doknr, stored in stored_items.items() if doknr not in current_doknrs]
+
+        _update_rows(cursor, Law.__tablename__, LAW_COLUMNS, [_law_row(law_id, gii_slug, law_dict)], casts={
+            "extra_abbreviations": "varchar[]", "publication_info": "jsonb", "status_info": "jsonb",
+        })
+        # New items first, so updated items can point to them, and removed items last, once nothing points to them.
+        copy_rows(cursor, ContentItem.__tablename__, CONTENT_ITEM_COLUMNS, inserted)
+        _update_rows(cursor, ContentItem.__tablename__, CONTENT_ITEM_COLUMNS, updated, casts={"parent_id": "integer"})
+        _update_rows(cursor, ContentItem.__tablename__, ["id", "parent_id", "order"], moved, casts={"parent_id": "integer"})
+        if deleted_ids:
+            cursor.execute("DELETE FROM content_items WHERE id = ANY(%s)", (deleted_ids,))
+
+        cursor.execute("SELECT name, data_uri FROM attachments WHERE law_id = %s", (law_id,))
+        if dict(cursor.fetchall()) != law_dict["attachments"]:
+            cursor.execute("DELETE FROM attachments WHERE law_id = %s", (law_id,))
+            copy_rows(cursor, Attachment.__tablename__, ATTACHMENT_COLUMNS, [
+                [law_id, name, data_uri] for name, data_uri in law_dict["attachments"].items()
+            ])
+    finally:
+        cursor.close()
+
+    return {"inserted": len(inserted), "updated": len(updated), "moved": len(moved), "deleted": len(deleted_ids)}
@@ -1,24 +1,34 @@
 from contextlib import contextmanager
+import itertools
 import os
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import load_only, sessionmaker, aliased
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import load_only, raiseload, sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
 
-from .models import Base, Law
+from .models import Attachment, Base, ContentItem, Law
 
 db_uri = os.environ.get("DB_URI") or "postgresql://localhost:5432/gadi"
-_engine = create_engine(db_uri)
-Session = sessionmaker(bind=_engine)
+_engine = None
+Session = sessionmaker()
+
+
+def get_engine():
+    """The engine for db_uri, created on first use rather than on import."""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(db_uri)
+    return _engine
 
 
 def init_db():
-    Base.metadata.create_all(_engine)
+    Base.metadata.create_all(get_engine())
 
 
 @contextmanager
 def session_scope():
     """Provide a transactional scope around a series of operations."""
-    session = Session()
+    session = Session(bind=get_engine())
     try:
         yield session
         session.commit()
@@ -29,33 +39,127 @@ def session_scope():
         session.close()
 
 
-def all_laws(session):
-    return session.query(Law).all()
+class _RowsByLawId:
+    """Rows ordered by law_id, taken one law at a time in ascending order of law ids."""
 
+    def __init__(self, rows):
+        self._groups = itertools.groupby(rows, key=lambda row: row.law_id)
+        self._next_group = next(self._groups, None)
 
-def all_laws_load_only_gii_slug_and_source_timestamp(session):
-    return session.query(Law).options(load_only("gii_slug", "source_timestamp")).all()
+    def take(self, law_id):
+        # Skip rows of laws that didn't exist yet when the laws were queried.
+        while self._next_group and self._next_group[0] is not None and self._next_group[0] < law_id:
+            self._next_group = next(self._groups, None)
+        if not self._next_group or self._next_group[0] != law_id:
+            return []
+        rows = list(self._next_group[1])
+        self._next_group = next(self._groups, None)
+        return rows
 
 
-def laws_with_duplicate_slugs(session):
-    law2 = aliased(Law)
-    law_pairs_query = (
-        session.query(Law, law2).
-        join(law2, Law.slug == law2.slug).filter(Law.id != law2.id)
+def all_law_summaries(session):
+    """All laws (ordered by id), with only the fields needed to index and export them loaded."""
+    return (
+        session.query(Law)
+        .options(load_only("slug", "abbreviation", "title_short", "title_long", "source_timestamp", "content_hash"))
+        .order_by(Law.id)
+        .all()
     )
 
-    dupes = {}
-    # Transform pairs to list per slug. (Needed in case more than 2 laws share a slug.)
-    for law1, law2 in law_pairs_query:
-        laws = dupes.setdefault(law1.slug, set())
-        laws.add(law1)
-        laws.add(law2)
 
-    return [list(laws) for laws in dupes.values()]
+def all_laws_with_contents(session, yield_per=100, law_ids=None):
+    """
+    Iterate over all laws (ordered by id) with their content items and
+    attachments, using one query per table however many laws there are. The
+    queries are read in parallel from server-side cursors, so only about
+    `yield_per` laws are held in memory at a time.
+
+    Parents of content items are looked up among the law's content items. Other
+    relationships raise instead of being loaded lazily.
 
+    :param law_ids: Only these laws, if given.
+    """
+    def query(model, law_id_column, *order_by):
+        query = session.query(model).options(raiseload("*")).order_by(*order_by)
+        if law_ids is not None:
+            query = query.filter(law_id_column.in_(law_ids))
+        return query
+
+    laws = query(Law, Law.id, Law.id).yield_per(yield_per)
+    content_items = _RowsByLawId(
+        query(ContentItem, ContentItem.law_id, ContentItem.law_id, ContentItem.order).yield_per(yield_per * 100)
+    )
+    attachments = _RowsByLawId(
+        query(Attachment, Attachment.law_id, Attachment.law_id, Attachment.name).yield_per(yield_per)
+    )
 
-def find_law_by_doknr(session, doknr):
-    return session.query(Law).filter_by(doknr=doknr).first()
+    for law in laws:
+        law_content_items = content_items.take(law.id)
+        content_items_by_id = {item.id: item for item in law_content_items}
+        for item in law_content_items:
+            set_committed_value(item, "parent", content_items_by_id.get(item.parent_id))
+        set_committed_value(law, "contents", law_content_items)
+        set_committed_value(law, "attachments", attachments.take(law.id))
+        yield law
+
+
+def all_laws_load_only_gii_slug_source_timestamp_and_content_hash(session):
+    return session.query(Law).options(load_only("gii_slug", "source_timestamp", "content_hash")).all()
+
+
+def resolve_slug_conflicts(session, slugs=None, overrides=None):
+    """
+    Give laws that share a slug their gii_slug as slug instead, or the one from
+    `overrides` ({slug: {gii_slug: new slug}}), with a single UPDATE. If `slugs`
+    is passed, only those slugs are checked for conflicts.
+
+    :return: The number of laws that got a new slug.
+    """
+    override_rows = [
+        (slug, gii_slug, new_slug)
+        for slug, new_slugs in (overrides or {}).items()
+        for gii_slug, new_slug in new_slugs.items()
+    ]
+    slug_filter = "" if slugs is None else "WHERE slug = ANY(:slugs)"
+    result = session.execute(text(f"""
+        UPDATE laws SET slug = coalesce((
+            SELECT o.new_slug
+            FROM unnest(CAST(:override_slugs AS varchar[]), CAST(:override_gii_slugs AS varchar[]),
+                        CAST(:override_new_slugs AS varchar[])) AS o(slug, gii_slug, new_slug)
+            WHERE o.slug = laws.slug AND o.gii_slug = laws.gii_slug
+        ), gii_slug)
+        WHERE slug IN (SELECT slug FROM laws {slug_filter} GROUP BY slug HAVING count(*) > 1)
+    """), {
+        "slugs": list(slugs or []),
+        "override_slugs": [row[0] for row in override_rows],
+        "override_gii_slugs": [row[1] for row in override_rows],
+        "override_new_slugs": [row[2] for row in override_rows],
+    })
+    return result.rowcount
+
+
+def check_slugs_unique(session):
+    """Check the (deferred) unique constraint on slugs now instead of on commit."""
+    session.execute(text("SET CONSTRAINTS laws_slug_key IMMEDIATE"))
+    session.execute(text("SET CONSTRAINTS laws_slug_key DEFERRED"))
+
+
+def find_law_id_by_doknr(session, doknr):
+    return session.query(Law.id).filter_by(doknr=doknr).scalar()
+
+
+def delete_laws_by_doknr(session, doknrs):
+    """
+    Delete laws with a single statement. Their content items and attachments are
+    removed by the database (ON DELETE CASCADE), without loading them first.
+
+    :return: The number of deleted laws.
+    """
+    doknrs = list(doknrs)
+    if not doknrs:
+        return 0
+    result = session.execute(Law.__table__.delete().where(Law.doknr.in_(doknrs)))
+    return result.rowcount
 
 
 def find_law_by_slug(session, slug):
@@ -63,4 +167,21 @@ def find_law_by_slug(session, slug):
 
 
 def bulk_delete_laws_by_gii_slug(session, gii_slugs):
-    Law.__table__.delete().where(Law.gii_slug.in_(gii_slugs))
+    """
+    Delete laws with a single statement, like delete_laws_by_doknr. The content
+    items and attachments removed by the cascade are counted in the same
+    statement, which still sees them.
+
+    :return: The numbers of deleted laws, content items and attachments.
+    """
+    gii_slugs = list(gii_slugs)
+    if not gii_slugs:
+        return {"laws": 0, "content_items": 0, "attachments": 0}
+    laws, content_items, attachments = session.execute(text("""
+        WITH deleted AS (DELETE FROM laws WHERE gii_slug = ANY(:gii_slugs) RETURNING id)
+        SELECT
+            (SELECT count(*) FROM deleted),
+            (SELECT count(*) FROM content_items WHERE law_id IN (SELECT id FROM deleted)),
+            (SELECT count(*) FROM attachments WHERE law_id IN (SELECT id FROM deleted))
+    """), {"gii_slugs": gii_slugs}).one()
+    return {"laws": laws, "content_items": content_items, "attachments": attachments}
@@ -1,13 +1,21 @@
+import collections
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import functools
 import gzip
+import io
+import itertools
 import json
+import multiprocessing
 import os
 import sys
 import tarfile
+import tempfile
 import tqdm
 
-from gadi import api_schemas, db, models
-from .parsing import parse_law
-from .download import fetch_toc, has_update
+# The DB layer (SQLAlchemy, psycopg2), the API schemas (pydantic) and the parser
+# (lxml) are imported in the functions using them, so that startup doesn't pay for them.
+from .parse_cache import cache_from_env, cache_key
+from .download import TOC_URL, HttpSession, fetch_toc
 
 
 def _calculate_diff(previous_slugs, current_slugs):
@@ -25,12 +33,15 @@ def _calculate_diff(previous_slugs, current_slugs):
     return existing, new, removed
 
 
-def _loop_with_progress(slugs, desc):
+def _loop_with_progress(slugs, desc, total=None):
+    if total is None:
+        total = len(slugs)
+
     pbar = None
     if sys.stdout.isatty():
-        pbar = tqdm.tqdm(total=len(slugs), desc=desc)
+        pbar = tqdm.tqdm(total=total, desc=desc)
     else:
-        print(desc, '-', len(slugs))
+        print(desc, '-', total)
 
     for slug in slugs:
         yield slug
@@ -41,6 +52,48 @@ def _loop_with_progress(slugs, desc):
         pbar.close()
 
 
+def _map_concurrently(slugs, fn, desc, concurrency):
+    """
+    Call fn for every slug on a pool of `concurrency` threads. Yields (slug, result)
+    pairs in completion order. Runs inline when concurrency is 1.
+    """
+    if concurrency <= 1:
+        for slug in _loop_with_progress(slugs, desc):
+            yield slug, fn(slug)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        futures = {executor.submit(fn, slug): slug for slug in slugs}
+        for future in _loop_with_progress(as_completed(futures), desc, total=len(futures)):
+            yield futures[future], future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _map_in_processes(slugs, fn, desc, workers):
+    """
+    Call fn for every slug on a pool of `workers` processes. Yields (slug, result)
+    pairs in the order of `slugs`. At most 2 * workers calls are in flight, so
+    results don't pile up in memory when the consumer is the bottleneck.
+
+    fn and its results need to be picklable. Workers are spawned rather than
+    forked, so they don't inherit open DB connections.
+    """
+    slugs = list(slugs)
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        to_submit = iter(slugs)
+        futures = collections.deque(executor.submit(fn, slug) for slug in itertools.islice(to_submit, 2 * workers))
+        for slug in _loop_with_progress(slugs, desc):
+            result = futures.popleft().result()
+            for next_slug in itertools.islice(to_submit, 1):
+                futures.append(executor.submit(fn, next_slug))
+            yield slug, result
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
 def _check_for_updates(slugs, check_fn):
     updated = set()
 
@@ -61,76 +114,296 @@ def _delete_removed(slugs, delete_fn):
         delete_fn(slug)
 
 
-def download_laws(location):
-    print("Fetching toc.xml")
-    download_urls = fetch_toc()
+def _download(slugs, download_fn, concurrency=1):
+    changed = set()
 
-    print("Loading timestamps")
-    laws_on_disk = location.list_slugs_with_timestamps()
-    existing, new, removed = _calculate_diff(laws_on_disk.keys(), download_urls.keys())
+    for slug, is_changed in _map_concurrently(slugs, download_fn, "Downloading new and updated laws", concurrency):
+        if is_changed:
+            changed.add(slug)
 
-    updated = _check_for_updates(existing, lambda slug: has_update(download_urls[slug], laws_on_disk[slug]))
-    new_or_updated = new.union(updated)
+    return changed
+
+
+def download_laws(location, concurrency=1, min_request_interval=0, toc_url=TOC_URL):
+    """
+    Bring `location` in sync with gesetze-im-internet.de.
 
-    _add_or_replace(new_or_updated, lambda slug: location.create_or_replace_law(slug, download_urls[slug]))
+    Existing laws are fetched with a conditional GET, so unchanged laws cost a
+    single 304 response.
+
+    :param concurrency: Number of laws to download in parallel. All requests share
+        one keep-alive connection pool of this size.
+    :param min_request_interval: Minimum number of seconds between two requests to
+        the same host.
+    """
+    with HttpSession(pool_size=concurrency, min_request_interval=min_request_interval) as http:
+        print("Fetching toc.xml")
+        download_urls = fetch_toc(http, toc_url)
+
+        print("Loading timestamps")
+        laws_on_disk = location.list_slugs_with_timestamps()
+        existing, new, removed = _calculate_diff(laws_on_disk.keys(), download_urls.keys())
+
+        changed = _download(
+            new.union(existing),
+            lambda slug: location.create_or_replace_law(slug, download_urls[slug], http),
+            concurrency
+        )
+        print(f"Downloaded {len(new)} new and {len(changed - new)} updated laws")
 
     _delete_removed(removed, lambda slug: location.remove_law(slug))
 
 
-def _fixup_slug_duplicates(session):
+def _fixup_slug_duplicates(session, slugs=None):
     """Use gii_slug as a law's slug in case of conflicts (except for a handful cases)."""
+    from gadi import db
+
     overrides = {
         "aeg": {"aeg_1994": "aeg", "aeg": "aeg_2"},
         "afrg": {"altfrg": "afrg", "afrg": "afrg_2"},
         "gbv": {"gbv_2011": "gbv"},
         "stvo": {"stvo_2013": "stvo"}
     }
-    dupes_by_slug = db.laws_with_duplicate_slugs(session)
-
-    for dupes in dupes_by_slug:
-        slug_overrides = overrides.get(dupes[0].slug, {})
-        for law in dupes:
-            law.slug = slug_overrides.get(law.gii_slug, law.gii_slug)
-
-    session.commit()
-
+    db.resolve_slug_conflicts(session, slugs, overrides)
+
+
+# Unique violation and deadlock: both can be caused by a concurrent writer (see _ingest_batch).
+RETRYABLE_PGCODES = {"23505", "40P01"}
+
+
+def _is_retryable(e):
+    return getattr(getattr(e, "orig", e), "pgcode", None) in RETRYABLE_PGCODES
+
+
+def _make_add_fn(session, location, incremental, batch_size, cache, failures, retries=0):
+    """
+    Build add_fn(slug, law_dict=None), which writes a law in its own savepoint and
+    commits every `batch_size` laws. Laws that fail are recorded in `failures`
+    instead of raising. Writes failing on a concurrent writer are retried up to
+    `retries` times; by then, the other transaction has finished and its laws can
+    be taken into account.
+    """
+    uncommitted = 0
+
+    def add_fn(slug, law_dict=None):
+        nonlocal uncommitted
+        for attempt in itertools.count():
+            try:
+                if law_dict is None:
+                    law_dict = load_law_dict(location, slug, cache)
+                elif isinstance(law_dict, Exception):
+                    raise law_dict
+                with session.begin_nested():
+                    ingest_law(session, location, slug, law_dict, incremental, cache)
+                break
+            except Exception as e:
+                if attempt < retries and _is_retryable(e):
+                    continue
+                failures[slug] = e
+                return
+
+        uncommitted += 1
+        if uncommitted >= batch_size:
+            session.commit()
+            uncommitted = 0
+
+    return add_fn
+
+
+def _ingest_batch(location, slugs, incremental, retries):
+    """
+    Write `slugs` in one transaction of a session of its own. Runs in the writer
+    processes of ingest_data_from_location, each with its own engine.
+
+    :return: Exceptions for the laws that failed, by gii_slug (as plain Exceptions, for pickling).
+    """
+    from gadi import db
+
+    failures = {}
+    with db.session_scope() as session:
+        add_fn = _make_add_fn(session, location, incremental, len(slugs), cache_from_env(), failures, retries)
+        for slug in slugs:
+            add_fn(slug)
+    return {slug: Exception(f"{type(e).__name__}: {e}") for slug, e in failures.items()}
+
+
+def _ingest_in_processes(location, slugs, incremental, batch_size, writers):
+    """
+    Write laws from a pool of `writers` processes, one batch of `batch_size` laws
+    (in order of gii_slug) at a time. Laws whose slugs could conflict tend to end
+    up in the same batch, so concurrent writers rarely need to retry.
+    """
+    slugs = sorted(slugs)
+    batches = [slugs[i:i + batch_size] for i in range(0, len(slugs), batch_size)]
+    failures = {}
+    executor = ProcessPoolExecutor(max_workers=writers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        futures = [executor.submit(_ingest_batch, location, batch, incremental, 3) for batch in batches]
+        desc = f"Adding new and updated laws in batches of {batch_size}"
+        for future in _loop_with_progress(as_completed(futures), desc, total=len(futures)):
+            failures.update(future.result())
+    finally:
+        executor.shutdown(cancel_futures=True)
+    return failures
+
+
+def ingest_data_from_location(session, location, workers=1, incremental=True, batch_size=50, writers=1):
+    """
+    Bring the DB in sync with the laws in `location`.
+
+    Each law is written in its own savepoint, so a law that fails to parse or
+    to be written is skipped (and reported) without affecting the others.
+
+    :param workers: Number of processes parsing laws in parallel. Parsed laws are
+        written to the DB by this process, one at a time and in a fixed order.
+    :param incremental: Only write the changed content items of updated laws
+        (see ingest_law).
+    :param batch_size: Number of laws written per transaction.
+    :param writers: Number of processes parsing and writing laws in parallel, each
+        with its own DB connection. Overrides `workers`. Removed laws are deleted
+        by this process once all writers are done.
+    :return: Exceptions for the laws that failed, by gii_slug.
+    """
+    from gadi import db
 
-def ingest_data_from_location(session, location):
     print("Loading timestamps")
     laws_on_disk = location.list_slugs_with_timestamps()
+    hashes_on_disk = location.list_slugs_with_content_hashes()
     laws_in_db = {
-        law.gii_slug: law.source_timestamp
-        for law in db.all_laws_load_only_gii_slug_and_source_timestamp(session)
+        law.gii_slug: (law.source_timestamp, law.content_hash)
+        for law in db.all_laws_load_only_gii_slug_source_timestamp_and_content_hash(session)
     }
     existing, new, removed = _calculate_diff(laws_in_db.keys(), laws_on_disk.keys())
 
-    updated = _check_for_updates(existing, lambda slug: laws_on_disk[slug] > laws_in_db[slug])
+    def check_fn(slug):
+        source_timestamp, content_hash = laws_in_db[slug]
+        if content_hash:
+            # Laws are often re-published unchanged, so only the content hash tells if anything changed.
+            return hashes_on_disk[slug] != content_hash
+        return laws_on_disk[slug] > source_timestamp
+
+    updated = _check_for_updates(existing, check_fn)
     new_or_updated = new.union(updated)
 
-    def add_fn(slug):
-        ingest_law(session, location, slug)
+    cache = cache_from_env()
+    failures = {}
+    add_fn = _make_add_fn(session, location, incremental, batch_size, cache, failures)
+
+    if writers > 1:
+        # Don't hold on to a transaction (and its snapshot) while the writers work.
         session.commit()
+        failures.update(_ingest_in_processes(location, new_or_updated, incremental, batch_size, writers))
+    elif workers > 1:
+        parsed_laws = _map_in_processes(
+            sorted(new_or_updated),
+            functools.partial(_try_load_law_dict, location, cache=cache),
+            "Adding new and updated laws",
+            workers
+        )
+        for slug, law_dict in parsed_laws:
+            add_fn(slug, law_dict)
+    else:
+        _add_or_replace(new_or_updated, add_fn)
+    session.commit()
 
-    _add_or_replace(new_or_updated, add_fn)
-    _fixup_slug_duplicates(session)
+    if failures:
+        print(f"Failed to ingest {len(failures)} laws:")
+        for slug, e in sorted(failures.items()):
+            print(f"  {slug}: {type(e).__name__}: {e}")
 
     print("Deleting removed laws")
-    db.bulk_delete_laws_by_gii_slug(session, removed)
+    deleted = db.bulk_delete_laws_by_gii_slug(session, removed)
     session.commit()
+    print(f"Deleted {deleted['laws']} laws ({deleted['content_items']} content items, "
+          f"{deleted['attachments']} attachments)")
+
+    return failures
+
+
+def _read_xml(file_or_filepath):
+    if hasattr(file_or_filepath, "read"):
+        with file_or_filepath:
+            return file_or_filepath.read()
+    with open(file_or_filepath, "rb") as f:
+        return f.read()
+
+
+def _parse_law_fully(xml_bytes):
+    from .parsing import NormOrderError, parse_law, parse_law_streaming
+
+    try:
+        law_dict = parse_law_streaming(io.BytesIO(xml_bytes))
+        law_dict["contents"] = list(law_dict["contents"])
+        return law_dict
+    except NormOrderError:
+        return parse_law(io.BytesIO(xml_bytes))
+
+
+def load_law_dict(location, gii_slug, cache=None):
+    """
+    Parse a law, including its attachments, into a plain (picklable) dict. With
+    a parse_cache.ParseCache, laws whose XML has been parsed before aren't parsed
+    again.
+    """
+    xml_bytes = _read_xml(location.xml_file_for(gii_slug))
+    law_dict = None
+    if cache:
+        key = cache_key(xml_bytes)
+        law_dict = cache.get(key)
+    if law_dict is None:
+        law_dict = _parse_law_fully(xml_bytes)
+        if cache:
+            cache.put(key, law_dict)
 
-
-def ingest_law(session, location, gii_slug):
-    law_dict = parse_law(location.xml_file_for(gii_slug))
     law_dict["attachments"] = location.attachments(gii_slug)
-    law = models.Law.from_dict(law_dict, gii_slug)
-
-    existing_law = db.find_law_by_doknr(session, law.doknr)
-    if existing_law:
-        session.delete(existing_law)
-        session.flush()
-    session.add(law)
+    law_dict["content_hash"] = location.content_hash_for(gii_slug)
+    return law_dict
+
+
+def _try_load_law_dict(location, gii_slug, cache=None):
+    """
+    load_law_dict, but returning errors instead of raising them, so that one bad
+    law doesn't stop a process pool. The error is flattened to a plain Exception
+    because not every exception survives pickling.
+    """
+    try:
+        return load_law_dict(location, gii_slug, cache)
+    except Exception as e:
+        return Exception(f"{type(e).__name__}: {e}")
+
+
+def ingest_law(session, location, gii_slug, law_dict=None, incremental=True, cache=None):
+    """
+    Write the law to the DB, replacing any previous version. Parses the law
+    unless an already parsed `law_dict` is passed in, through `cache` or else the
+    parse cache configured by the environment (see parse_cache.cache_from_env).
+
+    By default, a previous version is updated in place (see bulk.update_law), so
+    only changed content items are written. With incremental=False, it is
+    deleted and the law inserted anew (see bulk.insert_laws).
+
+    Slug conflicts caused by the law are resolved right away (see
+    _fixup_slug_duplicates), so an unresolvable conflict fails this law only.
+
+    :return: The law's ID.
+    """
+    from gadi import bulk, db
+    from gadi.models import slugify
+
+    if law_dict is None:
+        law_dict = load_law_dict(location, gii_slug, cache if cache is not None else cache_from_env())
+
+    law_id = db.find_law_id_by_doknr(session, law_dict["doknr"]) if incremental else None
+    if law_id is not None:
+        bulk.update_law(session, law_id, gii_slug, law_dict)
+    else:
+        if not incremental:
+            db.delete_laws_by_doknr(session, [law_dict["doknr"]])
+        [law_id] = bulk.insert_laws(session, {gii_slug: law_dict})
 
-    return law
+    _fixup_slug_duplicates(session, [slugify(law_dict["abbreviation"])])
+    db.check_slugs_unique(session)
+    return law_id
 
 
 def _write_file(filepath, content):
@@ -138,50 +411,211 @@ def _write_file(filepath, content):
         f.write(content + "\n")
 
 
-def _write_gzipped_file(filepath, content):
-    with gzip.open(filepath, "wb") as f:
-        f.write((content + "\n").encode("utf-8"))
+def _encode_json(data):
+    """Same as pydantic's .json(indent=2) for the model's .dict()."""
+    return json.dumps(data, indent=2)
 
 
-def write_all_law_json_files(session, dir_path):
-    laws_path = dir_path + "/laws"
-    os.makedirs(laws_path, exist_ok=True)
+def _write_json_list_items(f, encoded_items):
+    """
+    Write items encoded one at a time (see _encode_json) as the elements of a
+    list nested in an object, exactly like json.dumps(..., indent=2) would.
+
+    :return: Whether there were any items.
+    """
+    empty = True
+    for encoded_item in encoded_items:
+        f.write("\n    " if empty else ",\n    ")
+        # Strings in JSON can't contain line breaks, so every line break is between tokens.
+        f.write(encoded_item.replace("\n", "\n    "))
+        empty = False
+    return not empty
+
+
+def _write_gzipped_json_list(filepath, key, write_items):
+    """
+    Write {key: [...]} to a gzipped file, with write_items(f) writing the list's
+    elements (see _write_json_list_items) and returning whether there were any.
+    """
+    with gzip.open(filepath, "wt", encoding="utf-8") as f:
+        f.write("{\n  " + json.dumps(key) + ": [")
+        f.write("\n  ]\n}\n" if write_items(f) else "]\n}\n")
+
+
+# Bump when the JSON files change for the same law data, so they are all written anew.
+# Parser changes are covered by parsing.PARSER_VERSION, which is part of the manifest too.
+EXPORT_VERSION = 1
+MANIFEST_FILENAME = "__manifest.json"
+INDEX_FILENAME = "__index.json"
+_LAW_RESPONSE_PREFIX = '{\n  "data": '
+_LAW_RESPONSE_SUFFIX = "\n}"
+
+
+def _law_response_json(encoded_law):
+    """A LawResponse for an encoded law, as LawResponse(...).json(indent=2) would write it."""
+    return _LAW_RESPONSE_PREFIX + encoded_law.replace("\n", "\n  ") + _LAW_RESPONSE_SUFFIX
 
-    all_laws = []
-    laws_index = []
 
-    for law in db.all_laws(session):
-        law_api_model = api_schemas.LawAllFields.from_orm_model(law, include_contents=True)
-        single_law_response = api_schemas.LawResponse(data=law_api_model)
-        _write_file(f"{laws_path}/{law.slug}.json", single_law_response.json(indent=2))
+def _read_encoded_law(filepath):
+    """The encoded law from a file written by _write_law_json_files (inverse of _law_response_json)."""
+    with open(filepath, encoding="utf-8") as f:
+        response_json = f.read()[:-1]  # see _write_file
+    return response_json[len(_LAW_RESPONSE_PREFIX):-len(_LAW_RESPONSE_SUFFIX)].replace("\n  ", "\n")
 
-        all_laws.append(law_api_model.dict())
-        laws_index.append(dict(
+
+def _write_law_json_files(session, laws_path, law_ids=None):
+    """Write a JSON file for every law (or the laws with `law_ids`)."""
+    from gadi import api_schemas, db
+
+    for law in db.all_laws_with_contents(session, law_ids=law_ids):
+        encoded_law = _encode_json(api_schemas.law_dict_from_orm_model(law, include_contents=True))
+        _write_file(f"{laws_path}/{law.slug}.json", _law_response_json(encoded_law))
+
+
+def _write_law_json_files_with_own_session(laws_path, law_ids):
+    """_write_law_json_files in the worker processes of _write_law_json_files_in_processes."""
+    from gadi import db
+
+    with db.session_scope() as session:
+        _write_law_json_files(session, laws_path, law_ids)
+
+
+def _partition(law_ids, count):
+    """Split law IDs into up to `count` consecutive parts of about the same size."""
+    size = max(-(-len(law_ids) // count), 1)
+    return [law_ids[i:i + size] for i in range(0, len(law_ids), size)]
+
+
+def _write_law_json_files_in_processes(laws_path, law_ids, workers):
+    """Write the JSON files for the laws with `law_ids` from a pool of `workers` processes."""
+    # Several parts per worker, since a few laws (BGB, SGB, ...) are much larger than the rest.
+    parts = _partition(law_ids, 4 * workers)
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        futures = [executor.submit(_write_law_json_files_with_own_session, laws_path, part) for part in parts]
+        for future in _loop_with_progress(futures, "Writing law JSON files"):
+            future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _export_version():
+    from . import parsing
+
+    return [EXPORT_VERSION, parsing.PARSER_VERSION]
+
+
+def _read_manifest(dir_path):
+    """Manifest entries (see _manifest_entry) by slug of the last export to `dir_path`."""
+    try:
+        with open(os.path.join(dir_path, MANIFEST_FILENAME)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if manifest.get("export_version") != _export_version():
+        return {}
+    return manifest["laws"]
+
+
+def _write_manifest(dir_path, entries):
+    filepath = os.path.join(dir_path, MANIFEST_FILENAME)
+    with tempfile.NamedTemporaryFile("w", dir=dir_path, prefix=".", delete=False) as f:
+        json.dump({"export_version": _export_version(), "laws": entries}, f, indent=2, sort_keys=True)
+    os.replace(f.name, filepath)
+
+
+def _manifest_entry(law):
+    return {"source_timestamp": law.source_timestamp, "content_hash": law.content_hash}
+
+
+def write_all_law_json_files(session, dir_path, workers=1):
+    """
+    Write a JSON file per law, all_laws.json.gz and an index of all laws.
+
+    The export is incremental: a manifest in `dir_path` records each exported
+    law's source_timestamp and content_hash, and only the files of laws that
+    changed since are written. Files of removed laws are deleted. All other law
+    files are left untouched, and all_laws.json.gz is put together from them.
+
+    Laws are converted with api_schemas.law_dict_from_orm_model rather than the
+    (validating) models.
+
+    :param workers: Number of processes writing law files in parallel, each with
+        its own DB connection. The output is the same as with a single process.
+    :return: Whether anything changed.
+    """
+    from gadi import db
+
+    laws_path = dir_path + "/laws"
+    os.makedirs(laws_path, exist_ok=True)
+    bulk_file_path = f"{dir_path}/all_laws.json.gz"
+    index_path = f"{laws_path}/{INDEX_FILENAME}"
+
+    laws = db.all_law_summaries(session)
+    previous_manifest = _read_manifest(dir_path)
+    manifest = {law.slug: _manifest_entry(law) for law in laws}
+
+    changed_law_ids = [
+        law.id for law in laws
+        # Without a content hash, there's no telling if a law changed.
+        if law.content_hash is None or previous_manifest.get(law.slug) != manifest[law.slug]
+        or not os.path.exists(f"{laws_path}/{law.slug}.json")
+    ]
+    removed_filenames = [
+        filename for filename in os.listdir(laws_path)
+        if filename.endswith(".json") and filename != INDEX_FILENAME and filename[:-len(".json")] not in manifest
+    ]
+    if not changed_law_ids and not removed_filenames and os.path.exists(bulk_file_path) \
+            and os.path.exists(index_path):
+        print("No laws changed")
+        return False
+
+    print(f"Writing {len(changed_law_ids)} changed laws, deleting {len(removed_filenames)} removed laws")
+    if workers > 1:
+        _write_law_json_files_in_processes(laws_path, changed_law_ids, workers)
+    elif changed_law_ids:
+        _write_law_json_files(session, laws_path, changed_law_ids)
+    for filename in removed_filenames:
+        os.remove(f"{laws_path}/{filename}")
+
+    _write_gzipped_json_list(bulk_file_path, "data", lambda f: _write_json_list_items(
+        f, (_read_encoded_law(f"{laws_path}/{law.slug}.json") for law in laws)
+    ))
+
+    laws_index = [
+        dict(
             abbreviation=law.abbreviation,
             slug=law.slug,
             name=law.title_short or law.title_long,
             source_timestamp=law.source_timestamp,
-        ))
-
-    _write_gzipped_file(f"{dir_path}/all_laws.json.gz", json.dumps({'data': all_laws}, indent=2))
+        )
+        for law in laws
+    ]
     sorted_laws_index = sorted(laws_index, key=lambda l: l["abbreviation"])
-    _write_file(f"{laws_path}/__index.json", json.dumps(sorted_laws_index, indent=2))
+    _write_file(index_path, json.dumps(sorted_laws_index, indent=2))
+
+    # Last, so that an interrupted export is picked up again on the next run.
+    _write_manifest(dir_path, manifest)
+    return True
 
 
 def write_law_json_file(law, dir_path):
+    from gadi import api_schemas
+
     filepath = f"{dir_path}/{law.slug}.json"
-    law_schema = api_schemas.LawAllFields.from_orm_model(law, include_contents=True)
-    response = api_schemas.LawResponse(data=law_schema)
-    _write_file(filepath, response.json(indent=2))
+    encoded_law = _encode_json(api_schemas.law_dict_from_orm_model(law, include_contents=True))
+    _write_file(filepath, _law_response_json(encoded_law))
 
 
-def generate_static_assets(session, output_dir):
+def generate_static_assets(session, output_dir, workers=1):
     tarfilename = "all_laws.tar.gz"
+    tarfilepath = f"{output_dir}/{tarfilename}"
 
     print("Generating json files")
-    write_all_law_json_files(session, output_dir)
+    changed = write_all_law_json_files(session, output_dir, workers)
+    if not changed and os.path.exists(tarfilepath):
+        return
 
     print("Creating tarball")
-    tarfilepath = f"{output_dir}/{tarfilename}"
     with tarfile.open(tarfilepath, "w:gz") as tf:
         tf.add(output_dir + "/laws", arcname="laws")
@@ -1,24 +1,89 @@
+import abc
 import base64
 import datetime as dt
-from email.utils import parsedate_to_datetime
+from email.utils import format_datetime, parsedate_to_datetime
 import glob
-from io import BytesIO
+import hashlib
+import json
 import mimetypes
 import os
 import shutil
+import tempfile
+import threading
+import time
 from urllib.parse import urlparse
 import zipfile
 
-from lxml import etree
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .manifest import Manifest
 
 TOC_URL = "http://www.gesetze-im-internet.de/gii-toc.xml"
 
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MANIFEST_FILENAME = ".manifest.sqlite3"
+ZIP_LOCATION_PREFIX = "zip://"
+
+
+class _HostThrottle:
+    """Enforce a minimum interval between the start of two requests to the same host."""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, host):
+        if not self.min_interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+
+        time.sleep(slot - now)
+
+
+class HttpSession(requests.Session):
+    """
+    Connection-pooled session that can be shared between download threads.
+
+    Failed requests (connection errors and the statuses in RETRY_STATUSES) are
+    retried with exponential backoff, and requests to the same host are spaced
+    out by at least `min_request_interval` seconds.
+    """
+
+    def __init__(self, pool_size=1, min_request_interval=0, max_retries=3, backoff_factor=0.5, timeout=60):
+        super().__init__()
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=["HEAD", "GET"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.timeout = timeout
+        self._throttle = _HostThrottle(min_request_interval)
+
+    def request(self, method, url, **kwargs):
+        self._throttle.wait(urlparse(url).netloc)
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
 
-def fetch_toc():
-    response = requests.get(TOC_URL)
+
+def fetch_toc(http=requests, toc_url=TOC_URL):
+    response = http.get(toc_url)
     response.raise_for_status()
 
+    from lxml import etree
+
     toc = {}
 
     doc = etree.fromstring(response.content)
@@ -39,44 +104,285 @@ def _parse_last_modified_date_str(response):
         last_modified_date = dt.datetime.now()
 
     return last_modified_date.strftime("%Y%m%d")
-        
 
 
-def has_update(download_url, timestamp_string):
-    response = requests.head(download_url)
-    response.raise_for_status()
+def _conditional_headers(validators):
+    """Request headers that make the server answer 304 if the law hasn't changed since it was stored."""
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
 
-    return _parse_last_modified_date_str(response) > timestamp_string
+
+def _legacy_validators(timestamp_string):
+    """
+    Laws downloaded before validators were stored only have a day-granular
+    .timestamp. Treat them as current until the end of that day.
+    """
+    end_of_day = dt.datetime.strptime(timestamp_string, "%Y%m%d").replace(
+        hour=23, minute=59, second=59, tzinfo=dt.timezone.utc
+    )
+    return {"last_modified": format_datetime(end_of_day, usegmt=True)}
 
 
 def location_from_string(location_string):
+    if location_string.startswith(ZIP_LOCATION_PREFIX):
+        return ZipArchiveLocation(location_string[len(ZIP_LOCATION_PREFIX):])
     return LocalPathLocation(location_string)
 
 
-class LocalPathLocation:
+def _hash_law_file(content_hash, filename, size, f):
+    content_hash.update(f"{filename}\0{size}\0".encode("utf-8"))
+    for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+        content_hash.update(chunk)
+
+
+def _law_files(dir_path):
+    return sorted(filename for filename in os.listdir(dir_path) if not filename.startswith("."))
+
+
+def _content_hash(dir_path, filenames):
+    """SHA-256 over the names and contents of a law's files (XML and attachments)."""
+    content_hash = hashlib.sha256()
+    for filename in sorted(filenames):
+        path = os.path.join(dir_path, filename)
+        with open(path, "rb") as f:
+            _hash_law_file(content_hash, filename, os.path.getsize(path), f)
+    return content_hash.hexdigest()
+
+
+def _zip_law_files(zip_archive):
+    return sorted(
+        info.filename for info in zip_archive.infolist()
+        if not info.is_dir() and not os.path.basename(info.filename).startswith(".")
+    )
+
+
+def _zip_content_hash(zip_archive, filenames):
+    """Same as _content_hash, but for the files in a law archive."""
+    content_hash = hashlib.sha256()
+    for filename in sorted(filenames):
+        with zip_archive.open(filename) as f:
+            _hash_law_file(content_hash, filename, zip_archive.getinfo(filename).file_size, f)
+    return content_hash.hexdigest()
+
+
+def _manifest_entry(slug, filenames, content_hash, timestamp, validators):
+    xml_files = [filename for filename in filenames if filename.endswith(".xml")]
+    return {
+        "slug": slug,
+        "timestamp": timestamp,
+        "etag": validators.get("etag"),
+        "last_modified": validators.get("last_modified"),
+        "xml_file": xml_files[0] if len(xml_files) == 1 else None,
+        "attachments": [filename for filename in filenames if not filename.endswith(".xml")],
+        "content_hash": content_hash,
+    }
+
+
+def _data_uri(filename, data):
+    mimetype, _ = mimetypes.guess_type(filename, strict=False)
+    data_base64_bytes = base64.b64encode(data).decode("ascii")
+    return f"data:{mimetype};base64,{data_base64_bytes}"
+
+
+class _ManifestLocation(abc.ABC):
+    """
+    Base for locations that keep an index of their laws in a manifest (see
+    manifest.Manifest) at the top of the data dir. Subclasses decide how a
+    downloaded law archive is stored.
+    """
+
     def __init__(self, location_string):
         self.data_dir = location_string
+        self.manifest = Manifest(os.path.join(location_string, MANIFEST_FILENAME))
+
+    def __getstate__(self):
+        return {"location_string": self.data_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state["location_string"])
+
+    def _ensure_manifest(self):
+        os.makedirs(self.data_dir, exist_ok=True)
+
+    def _entry(self, slug):
+        return self.manifest.get(slug) if self.manifest.exists() else None
+
+    def _read_validators(self, slug):
+        return self._entry(slug) or {}
+
+    def create_or_replace_law(self, slug, download_url, http=requests):
+        """
+        Download the law with a conditional GET, based on the ETag and Last-Modified
+        validators stored with the previous download (if any).
+
+        The archive is streamed to a temporary file in the data dir. If its
+        content hash matches the stored law (the server often bumps Last-Modified
+        without changing anything), only the validators are updated. Otherwise
+        it is handed to _store_law. The manifest entry is updated afterwards, so
+        an interrupted download is retried rather than skipped on the next run.
+
+        :return: False if the law was unchanged (304 or same content), True if it was (re-)written.
+        """
+        self._ensure_manifest()
+        previous_entry = self._entry(slug)
+        conditional_headers = _conditional_headers(self._read_validators(slug))
+        with http.get(download_url, headers=conditional_headers, stream=True) as response:
+            if response.status_code == 304:
+                return False
+            response.raise_for_status()
+
+            archive = tempfile.NamedTemporaryFile(prefix=f".{slug}.", suffix=".zip", dir=self.data_dir, delete=False)
+            try:
+                with archive:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        archive.write(chunk)
+
+                with zipfile.ZipFile(archive.name) as zip_archive:
+                    filenames = _zip_law_files(zip_archive)
+                    content_hash = _zip_content_hash(zip_archive, filenames)
+
+                validators = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+                timestamp = _parse_last_modified_date_str(response)
+
+                if previous_entry and previous_entry["content_hash"] == content_hash:
+                    self.manifest.put({**previous_entry, "timestamp": timestamp, **validators})
+                    return False
+
+                entry = _manifest_entry(slug, filenames, content_hash, timestamp, validators)
+                self._store_law(slug, archive.name, entry)
+            finally:
+                if os.path.exists(archive.name):
+                    os.remove(archive.name)
+
+        self.manifest.put(entry)
+        return True
+
+    @abc.abstractmethod
+    def _store_law(self, slug, archive_path, entry):
+        """Store the downloaded archive (which is removed afterwards) as described by its manifest entry."""
+
+    def content_hash_for(self, slug):
+        return self._entry(slug)["content_hash"]
+
+    def list_slugs_with_content_hashes(self):
+        return {slug: entry["content_hash"] for slug, entry in self.manifest.all().items()}
+
+    def list_slugs_with_timestamps(self):
+        return {slug: entry["timestamp"] for slug, entry in self.manifest.all().items()}
+
+
+class LocalPathLocation(_ManifestLocation):
+    """
+    Laws extracted into one directory per law. Data dirs from before the manifest
+    existed are read by scanning the law directories, and the manifest is built
+    from them on the first write.
+    """
+
+    def __init__(self, location_string):
+        super().__init__(location_string)
+        self._manifest_init_lock = threading.Lock()
+
+    def _ensure_manifest(self):
+        with self._manifest_init_lock:
+            if self.manifest.exists():
+                return
+
+            super()._ensure_manifest()
+            print("Building manifest from law directories")
+            self.manifest.put(*[
+                self._legacy_manifest_entry(slug) for slug in self._list_legacy_slugs_with_timestamps()
+            ])
+
+    def _legacy_manifest_entry(self, slug):
+        dir_path = os.path.join(self.data_dir, slug)
+        filenames = _law_files(dir_path)
+        return _manifest_entry(slug, filenames, _content_hash(dir_path, filenames), *self._read_legacy_metadata(slug))
 
     def remove_law(self, slug):
+        self._ensure_manifest()
+        # Drop the manifest entry first: a leftover directory without an entry gets replaced on the next download.
+        self.manifest.delete(slug)
         shutil.rmtree(os.path.join(self.data_dir, slug), ignore_errors=True)
 
-    def create_or_replace_law(self, slug, download_url):
-        self.remove_law(slug)
-
+    def _read_legacy_metadata(self, slug):
+        """Timestamp and validators from the files written into each law directory."""
         dir_path = os.path.join(self.data_dir, slug)
-        os.makedirs(dir_path, exist_ok=True)
+        try:
+            with open(dir_path + "/.timestamp") as f:
+                timestamp = f.read()
+        except FileNotFoundError:
+            timestamp = "00000000"
+
+        try:
+            with open(dir_path + "/.validators") as f:
+                validators = json.load(f)
+        except FileNotFoundError:
+            try:
+                validators = _legacy_validators(timestamp)
+            except ValueError:
+                validators = {}
+
+        return timestamp, validators
+
+    def _read_validators(self, slug):
+        if self.manifest.exists():
+            return super()._read_validators(slug)
+        return self._read_legacy_metadata(slug)[1]
 
-        response = requests.get(download_url)
-        response.raise_for_status()
+    def _store_law(self, slug, archive_path, entry):
+        """Extract the archive into a fresh directory, which then replaces the law's directory by rename."""
+        tmp_dir = tempfile.mkdtemp(prefix=f".{slug}.", dir=self.data_dir)
+        os.chmod(tmp_dir, 0o755)
+        try:
+            with zipfile.ZipFile(archive_path) as zip_archive:
+                zip_archive.extractall(tmp_dir)
 
-        zip_archive = zipfile.ZipFile(BytesIO(response.content))
-        zip_archive.extractall(dir_path)
+            with open(tmp_dir + "/.timestamp", "w") as f:
+                f.write(entry["timestamp"])
+            with open(tmp_dir + "/.validators", "w") as f:
+                json.dump({"etag": entry["etag"], "last_modified": entry["last_modified"]}, f)
 
-        timestamp = _parse_last_modified_date_str(response)
-        with open(dir_path + "/.timestamp", "w") as f:
-            f.write(timestamp)
+            self._replace_law_dir(slug, tmp_dir)
+        except:  # noqa
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def _replace_law_dir(self, slug, new_dir):
+        dir_path = os.path.join(self.data_dir, slug)
+        old_dir = None
+        if os.path.exists(dir_path):
+            old_dir = tempfile.mkdtemp(prefix=f".{slug}.old.", dir=self.data_dir)
+            os.rename(dir_path, os.path.join(old_dir, slug))
+
+        os.rename(new_dir, dir_path)
+
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
 
     def list_slugs_with_timestamps(self):
+        if self.manifest.exists():
+            return super().list_slugs_with_timestamps()
+        return self._list_legacy_slugs_with_timestamps()
+
+    def content_hash_for(self, slug):
+        if self.manifest.exists():
+            return super().content_hash_for(slug)
+        dir_path = os.path.join(self.data_dir, slug)
+        return _content_hash(dir_path, _law_files(dir_path))
+
+    def list_slugs_with_content_hashes(self):
+        if self.manifest.exists():
+            return super().list_slugs_with_content_hashes()
+        return {slug: self.content_hash_for(slug) for slug in self._list_legacy_slugs_with_timestamps()}
+
+    def _list_legacy_slugs_with_timestamps(self):
         result = {}
 
         for path in glob.glob(f"{self.data_dir}/*/"):
@@ -92,6 +398,11 @@ class LocalPathLocation:
 
     def xml_file_for(self, slug):
         law_dir = os.path.join(self.data_dir, slug)
+        entry = self._entry(slug)
+        if entry:
+            assert entry["xml_file"], f"Expected 1 XML file in {law_dir}"
+            return os.path.join(law_dir, entry["xml_file"])
+
         xml_files = glob.glob(f"{law_dir}/*.xml")
         assert len(xml_files) == 1, f"Expected 1 XML file in {law_dir}, got {len(xml_files)}"
 
@@ -99,17 +410,69 @@ class LocalPathLocation:
 
     def attachments(self, slug):
         law_dir = os.path.join(self.data_dir, slug)
-        all_files = glob.glob(f"{law_dir}/*")
-        attachments = {}
-        for path in all_files:
-            if path.endswith(".xml"):
-                continue
+        entry = self._entry(slug)
+        if entry:
+            paths = [os.path.join(law_dir, filename) for filename in entry["attachments"]]
+        else:
+            paths = [path for path in glob.glob(f"{law_dir}/*") if not path.endswith(".xml")]
 
-            mimetype, _ = mimetypes.guess_type(path, strict=False)
+        attachments = {}
+        for path in paths:
             with open(path, "rb") as file:
-                data = file.read()
-            data_base64_bytes = base64.b64encode(data).decode("ascii")
-            data_uri = f"data:{mimetype};base64,{data_base64_bytes}"
-
-            attachments[os.path.basename(path)] = data_uri
+                attachments[os.path.basename(path)] = _data_uri(path, file.read())
         return attachments
+
+
+class ZipArchiveLocation(_ManifestLocation):
+    """
+    Laws kept as the downloaded archives (one <slug>.zip per law), read in place
+    without extracting them. Selected with a "zip://" prefix in
+    location_from_string.
+    """
+
+    def _archive_path(self, slug):
+        return os.path.join(self.data_dir, slug + ".zip")
+
+    def remove_law(self, slug):
+        self._ensure_manifest()
+        self.manifest.delete(slug)
+        try:
+            os.remove(self._archive_path(slug))
+        except FileNotFoundError:
+            pass
+
+    def _store_law(self, slug, archive_path, entry):
+        os.chmod(archive_path, 0o644)
+        os.replace(archive_path, self._archive_path(slug))
+
+    def list_slugs_with_timestamps(self):
+        if not self.manifest.exists():
+            return {}
+        return super().list_slugs_with_timestamps()
+
+    def list_slugs_with_content_hashes(self):
+        if not self.manifest.exists():
+            return {}
+        return super().list_slugs_with_content_hashes()
+
+    def _law_entry(self, slug):
+        entry = self._entry(slug)
+        assert entry, f"No law {slug} in {self.data_dir}"
+        return entry
+
+    def xml_file_for(self, slug):
+        """Open file handle for the law's XML inside its archive."""
+        entry = self._law_entry(slug)
+        assert entry["xml_file"], f"Expected 1 XML file in {self._archive_path(slug)}"
+
+        with zipfile.ZipFile(self._archive_path(slug)) as zip_archive:
+            # The handle keeps the underlying file open after the ZipFile is closed.
+            return zip_archive.open(entry["xml_file"])
+
+    def attachments(self, slug):
+        entry = self._law_entry(slug)
+        with zipfile.ZipFile(self._archive_path(slug)) as zip_archive:
+            return {
+                os.path.basename(filename): _data_uri(filename, zip_archive.read(filename))
+                for filename in entry["attachments"]
+            }
@@ -0,0 +1,92 @@
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS laws (
+    slug TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    xml_file TEXT,
+    attachments TEXT NOT NULL,
+    content_hash TEXT NOT NULL
+)
+"""
+
+FIELDS = ["slug", "timestamp", "etag", "last_modified", "xml_file", "attachments", "content_hash"]
+
+
+def _entry_from_row(row):
+    entry = dict(zip(FIELDS, row))
+    entry["attachments"] = json.loads(entry["attachments"])
+    return entry
+
+
+class Manifest:
+    """
+    Index of all laws in a location, kept in a single SQLite file.
+
+    Entries are dicts with the keys in FIELDS: the day-granular timestamp, the
+    HTTP validators of the last download, the name of the law's XML file, the
+    names of its attachments and a hash of the law's content.
+
+    The connection is opened lazily and shared between threads, with access
+    serialized by a lock. Every write is its own transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def exists(self):
+        return self._conn is not None or os.path.exists(self.path)
+
+    def _connection(self):
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute(SCHEMA)
+                conn.commit()
+                self._conn = conn
+        return self._conn
+
+    def all(self):
+        conn = self._connection()
+        with self._lock:
+            rows = conn.execute(f"SELECT {', '.join(FIELDS)} FROM laws").fetchall()
+        return {row[0]: _entry_from_row(row) for row in rows}
+
+    def get(self, slug):
+        conn = self._connection()
+        with self._lock:
+            row = conn.execute(f"SELECT {', '.join(FIELDS)} FROM laws WHERE slug = ?", (slug,)).fetchone()
+        return row and _entry_from_row(row)
+
+    def put(self, *entries):
+        rows = [
+            tuple(json.dumps(entry[field]) if field == "attachments" else entry[field] for field in FIELDS)
+            for entry in entries
+        ]
+        conn = self._connection()
+        with self._lock, conn:
+            conn.executemany(f"INSERT OR REPLACE INTO laws VALUES ({', '.join('?' * len(FIELDS))})", rows)
+
+    def delete(self, slug):
+        conn = self._connection()
+        with self._lock, conn:
+            conn.execute("DELETE FROM laws WHERE slug = ?", (slug,))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+
+
+CACHE_DIR_ENV = "PARSE_CACHE_DIR"
+MAX_SIZE_ENV = "PARSE_CACHE_MAX_MB"
+DEFAULT_MAX_SIZE_MB = 1024
+ENTRY_SUFFIX = ".pickle.z"
+
+
+def cache_key(xml_bytes):
+    from . import parsing  # Not at the top, so that importing doesn't load lxml.
+
+    digest = hashlib.sha256(f"{parsing.PARSER_VERSION}\0".encode())
+    digest.update(xml_bytes)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    On-disk cache of parsed laws (as returned by parse_law), keyed by cache_key,
+    i.e. by the XML content and PARSER_VERSION. Entries are zlib-compressed
+    pickles, one file per law.
+
+    The cache is size-bounded: once it grows beyond max_size bytes, the least
+    recently used entries (by mtime, which is bumped on every hit) are removed
+    until it is below 90% of max_size. Writes are atomic, so several processes
+    can share a cache dir.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._size = None
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return pickle.loads(zlib.decompress(data))
+
+    def put(self, key, law_dict):
+        data = zlib.compress(pickle.dumps(law_dict, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix=".", delete=False) as f:
+            f.write(data)
+        os.replace(f.name, self._path(key))
+
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._entries())
+        else:
+            self._size += len(data)
+        if self._size > self.max_size:
+            self._evict()
+
+    def _entries(self):
+        """(mtime, path, size) for every entry."""
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, entry.path, stat.st_size
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        self._size = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self._size <= 0.9 * self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+
+def default_cache_dir():
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "gadi", "parse_cache")
+
+
+def cache_from_env():
+    """
+    The parse cache configured by the environment: PARSE_CACHE_DIR (unset or
+    empty to disable) and PARSE_CACHE_MAX_MB. The cache is opt-in, the ingest
+    task turns it on with default_cache_dir().
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+
+    max_size_mb = float(os.environ.get(MAX_SIZE_ENV, DEFAULT_MAX_SIZE_MB))
+    return ParseCache(cache_dir, int(max_size_mb * 1024 * 1024))
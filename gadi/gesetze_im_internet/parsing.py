@@ -1,114 +1,227 @@
-import itertools
-import xml.etree.ElementTree as ET
+import collections
+from xml.etree.ElementTree import _escape_attrib, _escape_cdata
 
-import declxml as xml
-from declxml import _PrimitiveValue, _string_parser, _hooks_apply_after_parse
 from lxml import etree
 
 from .utils import chunk_string
 
+# Bump whenever the output of parse_law changes, to invalidate cached results (see parse_cache).
+PARSER_VERSION = 3
 
-class _XmlPreservingStringValue(_PrimitiveValue):
+XML_NAMESPACE = "{http://www.w3.org/XML/1998/namespace}"
+
+
+class NormOrderError(Exception):
+    pass
+
+
+class _Path:
+    """Precompiled XPath, relative to the element it is called with."""
+
+    def __init__(self, path):
+        self.path = path
+        self._xpath = etree.XPath(path)
+
+    def find(self, element, required=False):
+        """First match (like ElementTree's find), or None."""
+        matches = self._xpath(element)
+        if matches:
+            return matches[0]
+        if required:
+            raise Exception(f'Missing required element "{self.path}" in norm {element.get("doknr")}')
+        return None
+
+    def findall(self, element):
+        return self._xpath(element)
+
+
+def _qname(name):
+    if name.startswith(XML_NAMESPACE):
+        return "xml:" + name[len(XML_NAMESPACE):]
+    raise Exception(f"Unexpected namespaced name encountered: {name}")
+
+
+def _serialize(element, parts):
     """
-    Hack to get at the element so we can serialize its content & children
-    (instead of just getting the element text).
-    Scaffolding copied from https://github.com/gatkin/declxml/blob/8cc2ff2fa813aa9d4c27d1964fe7d865029a1298/declxml.py
+    Serialize the element and its tail like xml.etree.ElementTree.tostring does
+    for the equivalent ElementTree element (e.g. "<BR />"). Comments and
+    processing instructions are dropped, as ElementTree's parser would, but
+    their tails are kept.
     """
-    def parse_at_element(
-        self,
-        element,  # type: ET.Element
-        state  # type: _ProcessorState
-    ):
-        # type: (...) -> Any
-        """Parse the primitive value at the XML element."""
-        if self._attribute:
-            parsed_value = self._parse_attribute(element, self._attribute, state)
+    tag = element.tag
+    if isinstance(tag, str):
+        if tag[0] == "{":
+            tag = _qname(tag)
+
+        start_tag = "<" + tag
+        for key, value in element.items():
+            if key[0] == "{":
+                key = _qname(key)
+            start_tag += ' %s="%s"' % (key, _escape_attrib(value))
+
+        parts.append(start_tag)
+        start_tag_idx = len(parts) - 1
+        if element.text:
+            parts.append(_escape_cdata(element.text))
+        for child in element:
+            _serialize(child, parts)
+
+        if len(parts) - 1 > start_tag_idx:
+            parts[start_tag_idx] += ">"
+            parts.append("</" + tag + ">")
         else:
-            serialised_element_content = "".join(
-                itertools.chain([element.text or ""], (ET.tostring(child, encoding="unicode") for child in element))
-            )
-            parsed_value = self._parser_func(serialised_element_content, state)
-
-        return _hooks_apply_after_parse(self._hooks, state, parsed_value)
-
-
-def node_as_string(
-    element_name,  # type: Text
-    attribute=None,  # type: Optional[Text]
-    required=True,  # type: bool
-    alias=None,  # type: Optional[Text]
-    default='',  # type: Optional[Text]
-    omit_empty=False,  # type: bool
-    strip_whitespace=True,  # type: bool
-    hooks=None  # type: Optional[Hooks]
-):
-    # type: (...) -> Processor
+            parts[start_tag_idx] += " />"
+
+    if element.tail:
+        parts.append(_escape_cdata(element.tail))
+
+
+def _text(element):
+    """Element text as ElementTree sees it, i.e. including the tails of any leading comments."""
+    text = element.text or ""
+    for child in element:
+        if isinstance(child.tag, str):
+            break
+        text += child.tail or ""
+    return text
+
+
+# Anything lxml serializes differently from ElementTree: comments and processing
+# instructions (dropped by ElementTree's parser), namespaces, attribute values
+# containing characters only ElementTree escapes, and text containing carriage
+# returns, which only lxml escapes. Called with cr="\r".
+_NEEDS_ET_SERIALIZATION = etree.XPath(
+    "boolean(.//comment() | .//processing-instruction() | .//*[namespace-uri()]"
+    " | .//@*[namespace-uri() or contains(., '>') or contains(., '\t')]"
+    " | .//text()[contains(., $cr)])"
+)
+
+
+def inner_xml(element):
     """
-    Custom processor for extractingXml nodes as strings. Used because some
-    fields contain embedded tags.
-    :param strip_whitespace: Indicates whether leading and trailing whitespace should be stripped
-        from parsed string values.
+    Text and serialized children of the element. Used because some fields
+    contain embedded tags. Like the text returned by ElementTree, the leading
+    text is not escaped.
     """
+    if len(element) == 0:
+        return element.text or ""
+
+    if not _NEEDS_ET_SERIALIZATION(element, cr="\r"):
+        children = "".join(etree.tostring(child, encoding="unicode", with_tail=True) for child in element)
+        return (element.text or "") + children.replace("/>", " />")
+
+    parts = [_text(element)]
+    leading = True
+    for child in element:
+        if leading and not isinstance(child.tag, str):
+            continue
+        leading = False
+        _serialize(child, parts)
+    return "".join(parts)
 
-    value_parser = _string_parser(strip_whitespace)
-    return _XmlPreservingStringValue(
-        element_name,
-        value_parser,
-        attribute,
-        required,
-        alias,
-        default,
-        omit_empty,
-        hooks
-    )
+
+def _string(element):
+    return _text(element).strip()
+
+
+def _xml_string(element):
+    return inner_xml(element).strip()
+
+
+def _attribute(element, name):
+    value = element.get(name)
+    if value is None:
+        raise Exception(f'Missing required attribute "{name}" on element <{element.tag}>')
+    return value.strip()
 
 
 EMPTY_CONTENT_PATTERNS = ["<P/>", "<P />", "<P>-</P>"]
-def _content_string_hooks_after_parse(_, text):
-    if text == '' or any(text == pat for pat in EMPTY_CONTENT_PATTERNS):
+def _content_string(text):
+    if not text or any(text == pat for pat in EMPTY_CONTENT_PATTERNS):
         return None
     return text
 
-content_string_hooks = xml.Hooks(after_parse=_content_string_hooks_after_parse)
-
-text_processor = xml.dictionary("textdaten/text", [
-        node_as_string("Content", required=False, hooks=content_string_hooks),
-        node_as_string("TOC", required=False, default=None),
-        node_as_string("Footnotes", required=False, default=None),
-    ], required=False, alias="text")
-
-header_norm_processor = xml.dictionary("norm", [
-    xml.array(xml.string("metadaten/jurabk", alias="jurabk")),
-    xml.array(xml.string("metadaten/amtabk", alias="amtabk", required=False)),
-    xml.string("metadaten/ausfertigung-datum", alias="first_published"),
-    xml.string(".", attribute="doknr"),
-    xml.string(".", attribute="builddate", alias="source_timestamp"),
-    node_as_string("metadaten/langue", alias="title_long"),
-    node_as_string("metadaten/kurzue", alias="title_short", required=False, default=None),
-    text_processor,
-    xml.array(xml.dictionary("metadaten/fundstelle", [
-        xml.string("periodikum", alias="periodical"),
-        xml.string("zitstelle", alias="reference")
-    ], required=False), alias="publication_info"),
-    xml.array(xml.dictionary("metadaten/standangabe", [
-        xml.string("standtyp", alias="category"),
-        node_as_string("standkommentar", alias="comment")
-    ], required=False), alias="status_info"),
-    node_as_string("textdaten/fussnoten/Content", required=False, default=None, alias="notes_documentary_footnotes", hooks=content_string_hooks),
-])
-
-body_norm_processor = xml.dictionary("norm", [
-    xml.string(".", attribute="doknr"),
-    text_processor,
-    node_as_string("textdaten/fussnoten/Content", required=False, default=None, alias="documentary_footnotes", hooks=content_string_hooks),
-    xml.string("metadaten/enbez", alias="name", required=False, default=None),
-    node_as_string("metadaten/titel", alias="title", required=False, default=None, hooks=content_string_hooks),
-    xml.dictionary("metadaten/gliederungseinheit", [
-        xml.string("gliederungskennzahl", alias="code"),
-        xml.string("gliederungsbez", alias="name"),
-        node_as_string("gliederungstitel", alias="title", required=False, default=None, hooks=content_string_hooks),
-    ], required=False, alias="section_info")
-])
+
+def _optional(value_fn, element, default=None):
+    return default if element is None else value_fn(element)
+
+
+JURABK = _Path("metadaten/jurabk")
+AMTABK = _Path("metadaten/amtabk")
+AUSFERTIGUNG_DATUM = _Path("metadaten/ausfertigung-datum")
+LANGUE = _Path("metadaten/langue")
+KURZUE = _Path("metadaten/kurzue")
+FUNDSTELLE = _Path("metadaten/fundstelle")
+PERIODIKUM = _Path("periodikum")
+ZITSTELLE = _Path("zitstelle")
+STANDANGABE = _Path("metadaten/standangabe")
+STANDTYP = _Path("standtyp")
+STANDKOMMENTAR = _Path("standkommentar")
+FUSSNOTEN_CONTENT = _Path("textdaten/fussnoten/Content")
+TEXT = _Path("textdaten/text")
+CONTENT = _Path("Content")
+TOC = _Path("TOC")
+FOOTNOTES = _Path("Footnotes")
+ENBEZ = _Path("metadaten/enbez")
+TITEL = _Path("metadaten/titel")
+GLIEDERUNGSEINHEIT = _Path("metadaten/gliederungseinheit")
+GLIEDERUNGSKENNZAHL = _Path("gliederungskennzahl")
+GLIEDERUNGSBEZ = _Path("gliederungsbez")
+GLIEDERUNGSTITEL = _Path("gliederungstitel")
+
+
+def _extract_text(norm):
+    text = TEXT.find(norm)
+    if text is None:
+        return {}
+    return {
+        "Content": _content_string(_optional(_xml_string, CONTENT.find(text))),
+        "TOC": _optional(_xml_string, TOC.find(text)),
+        "Footnotes": _optional(_xml_string, FOOTNOTES.find(text)),
+    }
+
+
+def _extract_header_norm(norm):
+    jurabk = [_string(element) for element in JURABK.findall(norm)]
+    if not jurabk:
+        raise Exception(f'Missing required element "{JURABK.path}" in norm {norm.get("doknr")}')
+
+    return {
+        "jurabk": jurabk,
+        "amtabk": [_string(element) for element in AMTABK.findall(norm)],
+        "first_published": _string(AUSFERTIGUNG_DATUM.find(norm, required=True)),
+        "doknr": _attribute(norm, "doknr"),
+        "source_timestamp": _attribute(norm, "builddate"),
+        "title_long": _xml_string(LANGUE.find(norm, required=True)),
+        "title_short": _optional(_xml_string, KURZUE.find(norm)),
+        "text": _extract_text(norm),
+        "publication_info": [
+            {
+                "periodical": _string(PERIODIKUM.find(element, required=True)),
+                "reference": _string(ZITSTELLE.find(element, required=True)),
+            }
+            for element in FUNDSTELLE.findall(norm)
+        ],
+        "status_info": [
+            {
+                "category": _string(STANDTYP.find(element, required=True)),
+                "comment": _xml_string(STANDKOMMENTAR.find(element, required=True)),
+            }
+            for element in STANDANGABE.findall(norm)
+        ],
+        "notes_documentary_footnotes": _content_string(_optional(_xml_string, FUSSNOTEN_CONTENT.find(norm))),
+    }
+
+
+def _extract_section_info(norm):
+    section = GLIEDERUNGSEINHEIT.find(norm)
+    if section is None:
+        return {}
+    return {
+        "code": _string(GLIEDERUNGSKENNZAHL.find(section, required=True)),
+        "name": _string(GLIEDERUNGSBEZ.find(section, required=True)),
+        "title": _content_string(_optional(_xml_string, GLIEDERUNGSTITEL.find(section))),
+    }
 
 
 def load_norms_from_file(file_or_filepath):
@@ -121,6 +234,28 @@ def load_norms_from_file(file_or_filepath):
     return doc.xpath("/dokumente/norm")
 
 
+def _iterparse_norms(f):
+    for _, norm in etree.iterparse(f, events=("end",), tag="norm"):
+        yield norm
+        # Drop the processed norm and everything before it, so the tree never
+        # holds more than the norm currently being parsed.
+        norm.clear()
+        while norm.getprevious() is not None:
+            del norm.getparent()[0]
+
+
+def iter_norms_from_file(file_or_filepath):
+    """
+    Like load_norms_from_file, but yields each norm as soon as it has been
+    read. Elements are cleared after use, so hold on to extracted values only.
+    """
+    if hasattr(file_or_filepath, "read"):
+        yield from _iterparse_norms(file_or_filepath)
+    else:
+        with open(file_or_filepath, "rb") as f:
+            yield from _iterparse_norms(f)
+
+
 def apply_transformer(dict, transform_func, replace=None, read=None):
     args = [dict.pop(key) for key in replace or []] + [dict[key] for key in read or []]
     new_entries = transform_func(*args)
@@ -134,13 +269,6 @@ def transform_notes_text(text_dict):
     }
 
 
-def transform_text(text_dict):
-    return {
-        "body": text_dict.get("Content") or text_dict.get("TOC"),
-        "footnotes": text_dict.get("Footnotes")
-    }
-
-
 def transform_abbreviations(amtabk, jurabk):
     primary, *rest = list(dict.fromkeys(amtabk + jurabk))
     return {
@@ -149,31 +277,45 @@ def transform_abbreviations(amtabk, jurabk):
     }
 
 
-def transform_item_type(doknr, body):
+class ContentItemRecord:
+    """
+    A parsed body norm: an article, heading or heading article. parent_index is
+    the position of the containing heading among the law's contents, or None.
+    """
+
+    __slots__ = ("doknr", "item_type", "name", "title", "body", "footnotes", "documentary_footnotes", "parent_index")
+
+    def __init__(self, doknr, item_type, name, title, body, footnotes, documentary_footnotes, parent_index):
+        self.doknr = doknr
+        self.item_type = item_type
+        self.name = name
+        self.title = title
+        self.body = body
+        self.footnotes = footnotes
+        self.documentary_footnotes = documentary_footnotes
+        self.parent_index = parent_index
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        return f"ContentItemRecord({self.doknr!r}, {self.item_type!r}, parent_index={self.parent_index!r})"
+
+
+def _item_type(doknr, body):
     if "NE" in doknr:
-        return { "item_type": "article" }
+        return "article"
     elif "NG" in doknr:
         if body:
-            return { "item_type": "heading_article" }
+            return "heading_article"
         else:
-            return { "item_type": "heading" }
+            return "heading"
     else:
         raise Exception(f"Unknown norm structure encountered: {doknr}")
 
 
-def transform_name_and_title(section_info, name, title, item_type):
-    if item_type == "article":
-        return {
-            "name": name,
-            "title": title,
-        }
-    else:
-        return {
-            "name": section_info["name"],
-            "title": section_info["title"],
-        }
-
-
 def _find_parent(sections_by_code, code):
     """
     Search by iteratively removing 3 digits from the end of the code to find a
@@ -182,30 +324,29 @@ def _find_parent(sections_by_code, code):
     chunks = chunk_string(code, 3)
     for i in reversed(range(len(chunks) + 1)):
         substring = "".join(chunks[:i])
-        if sections_by_code.get(substring):
+        if sections_by_code.get(substring) is not None:
             return sections_by_code[substring]
     return None
 
 
-def _set_parent(item, parser_state):
-    code = item["section_info"] and item["section_info"]["code"]
-
-    if item["item_type"] == "article":
+def _parent_index(index, item_type, code, parser_state):
+    if item_type == "article":
         if code:
-            item["parent"] = _find_parent(parser_state["sections_by_code"], code)
+            parent_index = _find_parent(parser_state["sections_by_code"], code)
         else:
-            item["parent"] = parser_state["current_parent"]
+            parent_index = parser_state["current_parent"]
 
     else:
-        item["parent"] = _find_parent(parser_state["sections_by_code"], code)
-        parser_state["sections_by_code"][code] = parser_state["current_parent"] = item
+        parent_index = _find_parent(parser_state["sections_by_code"], code)
+        parser_state["sections_by_code"][code] = parser_state["current_parent"] = index
 
-    if item["parent"]:
-        parser_state["items_with_children"].add(item["parent"]["doknr"])
+    if parent_index is not None:
+        parser_state["items_with_children"].add(parent_index)
+    return parent_index
 
 
 def extract_law_attrs(header_norm):
-    law_dict = xml.parse_from_string(header_norm_processor, etree.tostring(header_norm, encoding="unicode"))
+    law_dict = _extract_header_norm(header_norm)
     apply_transformer(
         law_dict, transform_notes_text, replace=["text"]
     )
@@ -216,36 +357,110 @@ def extract_law_attrs(header_norm):
     return law_dict
 
 
-def extract_contents(body_norms):
-    parser_state = {
+def _extract_content_item(norm, index, parser_state):
+    """The norm's ContentItemRecord and its section code (if any)."""
+    doknr = _attribute(norm, "doknr")
+    text = _extract_text(norm)
+    body = text.get("Content") or text.get("TOC")
+    item_type = _item_type(doknr, body)
+    section_info = _extract_section_info(norm)
+
+    if item_type == "article":
+        name = _optional(_string, ENBEZ.find(norm))
+        title = _content_string(_optional(_xml_string, TITEL.find(norm)))
+    else:
+        name = section_info["name"]
+        title = section_info["title"]
+
+    code = section_info.get("code")
+    item = ContentItemRecord(
+        doknr=doknr,
+        item_type=item_type,
+        name=name,
+        title=title,
+        body=body,
+        footnotes=text.get("Footnotes"),
+        documentary_footnotes=_content_string(_optional(_xml_string, FUSSNOTEN_CONTENT.find(norm))),
+        parent_index=_parent_index(index, item_type, code, parser_state),
+    )
+    return item, code
+
+
+def _new_parser_state():
+    return {
         "current_parent": None,
         "sections_by_code": {"": None},
         "items_with_children": set(),
     }
 
+
+def extract_contents(body_norms):
+    parser_state = _new_parser_state()
+
     content_items = []
-    for norm in body_norms:
-        item = xml.parse_from_string(body_norm_processor, etree.tostring(norm, encoding="unicode"))
-        apply_transformer(
-            item, transform_text, replace=["text"],
-        )
-        apply_transformer(
-            item, transform_item_type, read=["doknr", "body"]
-        )
-        _set_parent(item, parser_state)
-        apply_transformer(
-            item, transform_name_and_title, replace=["section_info", "name", "title"], read=["item_type"]
-        )
+    for index, norm in enumerate(body_norms):
+        item, _ = _extract_content_item(norm, index, parser_state)
         content_items.append(item)
 
     # Convert empty heading articles to articles
-    for item in content_items:
-        if item["item_type"] == "heading_article" and item["doknr"] not in parser_state["items_with_children"]:
-            item["item_type"] = "article"
+    for index, item in enumerate(content_items):
+        if item.item_type == "heading_article" and index not in parser_state["items_with_children"]:
+            item.item_type = "article"
 
     return content_items
 
 
+def iter_contents(body_norms):
+    """
+    Generator version of extract_contents.
+
+    Whether a heading article is empty (and becomes an article) is only known
+    once no later norm can be its child, so items from the first undecided
+    heading article onwards are held back. Norms come in document order, so a
+    heading article is closed once a norm with a section code outside of its
+    own code appears, or once it has been replaced as the current section for
+    its code. If a later norm turns out to be a child of a heading article that
+    was already given out as an article, this raises NormOrderError; parse_law
+    still handles such laws.
+    """
+    parser_state = _new_parser_state()
+    held_back = collections.deque()
+    undecided = {}  # index -> (item, code) of heading articles without children so far
+    closed = set()
+
+    for index, norm in enumerate(body_norms):
+        item, code = _extract_content_item(norm, index, parser_state)
+
+        parent_index = item.parent_index
+        if parent_index is not None:
+            if parent_index in closed:
+                raise NormOrderError(f"Norm {item.doknr} is out of order: its parent was already closed")
+            undecided.pop(parent_index, None)
+
+        for heading_index, (heading_article, heading_code) in list(undecided.items()):
+            out_of_section = bool(code) and not code.startswith(heading_code)
+            replaced = (
+                parser_state["sections_by_code"].get(heading_code) != heading_index
+                and parser_state["current_parent"] != heading_index
+            )
+            if out_of_section or replaced:
+                heading_article.item_type = "article"
+                closed.add(heading_index)
+                del undecided[heading_index]
+
+        if item.item_type == "heading_article":
+            undecided[index] = (item, code)
+
+        held_back.append((index, item))
+        while held_back and held_back[0][0] not in undecided:
+            yield held_back.popleft()[1]
+
+    for heading_article, _ in undecided.values():
+        heading_article.item_type = "article"
+    for _, item in held_back:
+        yield item
+
+
 def parse_law(file_or_filepath):
     header_norm, *body_norms = load_norms_from_file(file_or_filepath)
 
@@ -253,3 +468,18 @@ def parse_law(file_or_filepath):
     law_attrs["contents"] = extract_contents(body_norms)
 
     return law_attrs
+
+
+def parse_law_streaming(file_or_filepath):
+    """
+    Like parse_law, but reads the file incrementally and returns the contents as
+    a generator (see iter_contents), so memory use is bounded by the largest
+    norm rather than the whole law. The file stays open until the contents have
+    been consumed.
+    """
+    norms = iter_norms_from_file(file_or_filepath)
+    law_attrs = extract_law_attrs(next(norms))
+    law_attrs["contents"] = iter_contents(norms)
+
+    return law_attrs
+
@@ -1,6 +1,6 @@
 import re
 
-from sqlalchemy import Column, ForeignKey, Index, Integer, String
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, UniqueConstraint
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -22,10 +22,14 @@ def slugify(string):
 
 class Law(Base):
     __tablename__ = "laws"
+    __table_args__ = (
+        # Deferred, so that conflicting slugs can be resolved after writing a law (see db.resolve_slug_conflicts).
+        UniqueConstraint("slug", name="laws_slug_key", deferrable=True, initially="DEFERRED"),
+    )
 
     id = Column(Integer, primary_key=True)
     doknr = Column(String, nullable=False, unique=True)
-    slug = Column(String, nullable=False, index=True)
+    slug = Column(String, nullable=False)
     gii_slug = Column(String, nullable=False, index=True)
     abbreviation = Column(String, nullable=False)
     extra_abbreviations = Column(postgresql.ARRAY(String), nullable=False)
@@ -38,6 +42,8 @@ class Law(Base):
     notes_body = Column(String)
     notes_footnotes = Column(String)
     notes_documentary_footnotes = Column(String)
+    # Hash of the downloaded XML and attachments (see gesetze_im_internet.download)
+    content_hash = Column(String)
 
     attachments = relationship(
         "Attachment",
@@ -63,11 +69,10 @@ class Law(Base):
             **{k: v for k, v in law_dict.items() if k not in ["contents", "attachments"]}
         )
 
-        content_item_dicts = law_dict["contents"]
-        content_items_by_doknr = {}
-        for idx, content_item_dict in enumerate(content_item_dicts):
-            content_item = ContentItem.from_dict(content_item_dict, idx, content_items_by_doknr)
-            content_items_by_doknr[content_item.doknr] = content_item
+        content_items = []
+        for idx, record in enumerate(law_dict["contents"]):
+            content_item = ContentItem.from_record(record, idx, content_items)
+            content_items.append(content_item)
             law.contents.append(content_item)
 
         attachments_dict = law_dict["attachments"]
@@ -89,20 +94,31 @@ class ContentItem(Base):
     footnotes = Column(String)
     documentary_footnotes = Column(String)
     law_id = Column(Integer, ForeignKey("laws.id", ondelete="CASCADE"), index=True)
-    parent_id = Column(Integer, ForeignKey("content_items.id"))
+    # Indexed so that deleting a law's content items (by cascade) doesn't scan the table for children.
+    parent_id = Column(Integer, ForeignKey("content_items.id"), index=True)
     order = Column(Integer, nullable=False)
+    # Hash of the item's own fields (see bulk.content_item_hash), to find changed items on update
+    content_hash = Column(String)
 
     law = relationship("Law", back_populates="contents")
     parent = relationship("ContentItem", remote_side=[id], uselist=False)
 
     @staticmethod
-    def from_dict(content_item_dict, order, content_items_by_doknr):
-        parent_dict = content_item_dict["parent"]
-        parent = parent_dict and content_items_by_doknr[parent_dict["doknr"]]
-
-        content_item_attrs = {k: v for k, v in content_item_dict.items() if k != "parent"}
-        content_item = ContentItem(parent=parent, order=order, **content_item_attrs)
-        return content_item
+    def from_record(record, order, preceding_content_items):
+        """Build from a parsing.ContentItemRecord, whose parent is among the preceding content items."""
+        parent = None if record.parent_index is None else preceding_content_items[record.parent_index]
+
+        return ContentItem(
+            doknr=record.doknr,
+            item_type=record.item_type,
+            name=record.name,
+            title=record.title,
+            body=record.body,
+            footnotes=record.footnotes,
+            documentary_footnotes=record.documentary_footnotes,
+            parent=parent,
+            order=order,
+        )
 
 
 class Attachment(Base):
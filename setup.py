@@ -16,5 +16,5 @@ setup(
     author_email="niko.felger@gmail.com",
     url="https://github.com/nfelger/gesetze-aus-dem-internet",
     license=license,
-    packages=find_packages(exclude=("tests", "docs", "example_json")),
+    packages=find_packages(exclude=("tests", "benchmarks", "docs", "example_json")),
 )
@@ -1,9 +1,9 @@
+import os
+
 from invoke import task, Collection
-from sqlalchemy.exc import OperationalError
-import sqlalchemy_utils
 
-from gadi import db, gesetze_im_internet
-from gadi.gesetze_im_internet.download import location_from_string
+# Modules of the gadi package (and their heavy dependencies) are imported by the
+# tasks that need them, so that listing tasks or downloading laws starts quickly.
 
 ns = Collection()
 
@@ -15,8 +15,12 @@ def db_init(c):
     """
     Set up database. (Set DB url with the DB_URI env variable.)
     """
+    from sqlalchemy.exc import OperationalError
+    import sqlalchemy_utils
+    from gadi import db
+
     try:
-        db._engine.connect().execute('select 1')
+        db.get_engine().connect().execute('select 1')
     except OperationalError:
         sqlalchemy_utils.create_database(db.db_uri)
 
@@ -53,27 +57,50 @@ ns.add_task(run_tests, 'tests')
 
 @task(
     help={
-        "data-location": "Where to store downloaded law data"
+        "data-location": "Where to store downloaded law data",
+        "concurrency": "Number of parallel downloads (default: 1)",
+        "delay": "Minimum seconds between two requests to gesetze-im-internet.de (default: 0)",
     }
 )
-def download_laws(c, data_location):
+def download_laws(c, data_location, concurrency=1, delay=None):
     """
     Download any updated law files from gesetze-im-internet.de.
     """
-    gesetze_im_internet.download_laws(location_from_string(data_location))
+    from gadi import gesetze_im_internet
+    from gadi.gesetze_im_internet.download import location_from_string
+
+    gesetze_im_internet.download_laws(
+        location_from_string(data_location), concurrency=concurrency, min_request_interval=float(delay or 0)
+    )
 
 
 @task(
     help={
-       "data-location": "Where law data has been downloaded"
+       "data-location": "Where law data has been downloaded",
+       "workers": "Number of processes parsing laws in parallel (default: 1)",
+       "incremental": "Only write changed paragraphs of updated laws (default); "
+                      "--no-incremental replaces updated laws entirely",
+       "batch-size": "Number of laws written per transaction (default: 50)",
+       "writers": "Number of processes parsing and writing laws in parallel, each with its own DB connection "
+                  "(default: 1)",
     }
 )
-def ingest_data_from_location(c, data_location):
+def ingest_data_from_location(c, data_location, workers=1, incremental=True, batch_size=50, writers=1):
     """
     Process downloaded laws and store/update them in the DB.
     """
+    from gadi import db, gesetze_im_internet
+    from gadi.gesetze_im_internet import parse_cache
+    from gadi.gesetze_im_internet.download import location_from_string
+
+    # Through the environment, so that worker processes use the cache as well.
+    os.environ.setdefault(parse_cache.CACHE_DIR_ENV, parse_cache.default_cache_dir())
+
     with db.session_scope() as session:
-        gesetze_im_internet.ingest_data_from_location(session, location_from_string(data_location))
+        gesetze_im_internet.ingest_data_from_location(
+            session, location_from_string(data_location), workers=workers, incremental=incremental,
+            batch_size=batch_size, writers=writers
+        )
 
 
 ns.add_collection(Collection(
@@ -94,6 +121,8 @@ def json_generate(c, law_abbr):
     """
     Update JSON response for a single law in example_json/.
     """
+    from gadi import db, gesetze_im_internet
+
     with db.session_scope() as session:
         law = db.find_law_by_slug(session, law_abbr)
         if not law:
@@ -129,13 +158,20 @@ ns.add_collection(Collection(
 
 # Deployment-related tasks
 
-@task
-def generate_static_assets(c, output_dir):
+@task(
+    help={
+        "output-dir": "Where to write the law files",
+        "workers": "Number of processes writing law files in parallel (default: 1)",
+    }
+)
+def generate_static_assets(c, output_dir, workers=1):
     """
     Generate and upload bulk law files.
     """
+    from gadi import db, gesetze_im_internet
+
     with db.session_scope() as session:
-        gesetze_im_internet.generate_static_assets(session, output_dir)
+        gesetze_im_internet.generate_static_assets(session, output_dir, workers=workers)
 
 
 ns.add_collection(Collection(
@@ -0,0 +1,11 @@
+import pytest
+
+from gadi.gesetze_im_internet import parse_cache
+
+
+@pytest.fixture(autouse=True, scope="session")
+def disable_parse_cache():
+    """Keep tests from reading and writing the developer's parse cache. Tests of the cache pass one in explicitly."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv(parse_cache.CACHE_DIR_ENV, "")
+        yield
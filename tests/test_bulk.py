@@ -0,0 +1,104 @@
+import io
+
+from lxml import etree
+import pytest
+
+from gadi import api_schemas, bulk, db, models
+from gadi.gesetze_im_internet import load_law_dict
+from gadi.gesetze_im_internet.download import LocalPathLocation
+from gadi.gesetze_im_internet.parsing import ContentItemRecord, parse_law
+from .utils import xml_fixtures_dir
+
+
+@pytest.fixture(autouse=True, scope="module")
+def init_db():
+    db.init_db()
+
+
+def test_insert_laws_escapes_values():
+    nasty = 'tab\there, newline\nthere, cr\r, backslash \\N \\, quote " and {braces}'
+    law_dict = {
+        "doknr": "BJNRBULKTEST",
+        "abbreviation": "BulkG",
+        "extra_abbreviations": [nasty, "NULL", ""],
+        "first_published": "2020-01-01",
+        "source_timestamp": "20200101000000",
+        "title_long": nasty,
+        "title_short": None,
+        "publication_info": [{"periodical": nasty, "reference": "1"}],
+        "status_info": [],
+        "notes_body": None,
+        "notes_footnotes": "\\N",
+        "notes_documentary_footnotes": None,
+        "content_hash": "abc",
+        "attachments": {"a.png": "data:image/png;base64,AAAA"},
+        "contents": [
+            ContentItemRecord("BJNRBULKTESTNG1", "heading", "Teil 1", nasty, None, None, None, None),
+            ContentItemRecord("BJNRBULKTESTNE1", "article", "§ 1", None, "<P>\\</P>", None, None, 0),
+        ],
+    }
+
+    with db.session_scope() as session:
+        session.query(models.Law).filter_by(doknr="BJNRBULKTEST").delete()
+        [law_id] = bulk.insert_laws(session, {"bulkg": law_dict})
+
+    with db.session_scope() as session:
+        law = session.query(models.Law).get(law_id)
+        assert law.slug == "bulkg"
+        assert law.gii_slug == "bulkg"
+        assert law.title_long == nasty
+        assert law.extra_abbreviations == [nasty, "NULL", ""]
+        assert law.publication_info == [{"periodical": nasty, "reference": "1"}]
+        assert law.notes_footnotes == "\\N"
+        assert law.notes_body is None
+        assert [(a.name, a.data_uri) for a in law.attachments] == [("a.png", "data:image/png;base64,AAAA")]
+
+        heading, article = law.contents
+        assert heading.title == nasty
+        assert heading.parent is None
+        assert article.body == "<P>\\</P>"
+        assert article.parent is heading
+        assert article.order == 1
+
+        session.delete(law)
+
+
+def _api_model(law):
+    return api_schemas.LawAllFields.from_orm_model(law, include_contents=True)
+
+
+def test_update_law_writes_only_changed_items():
+    location = LocalPathLocation(xml_fixtures_dir)
+    law_dict = load_law_dict(location, "skaufg")
+
+    doc = etree.parse(location.xml_file_for("skaufg"))
+    norms = doc.getroot().findall("norm")
+    norms[5].find("textdaten/text/Content/P").text = "Geänderter Text."
+    doc.getroot().remove(norms[7])
+    updated_law_dict = parse_law(io.BytesIO(etree.tostring(doc)))
+    updated_law_dict["attachments"] = {"new.png": "data:image/png;base64,AAAA"}
+    updated_law_dict["content_hash"] = "changed"
+
+    with db.session_scope() as session:
+        db.delete_laws_by_doknr(session, [law_dict["doknr"]])
+        [law_id] = bulk.insert_laws(session, {"skaufg": law_dict})
+        content_item_ids = {item.doknr: item.id for item in session.query(models.ContentItem).filter_by(law_id=law_id)}
+
+    with db.session_scope() as session:
+        counts = bulk.update_law(session, law_id, "skaufg", updated_law_dict)
+
+    # norms[0] is the header, so norms[5] is contents[4]
+    assert counts == {"inserted": 0, "updated": 1, "moved": len(law_dict["contents"]) - 7, "deleted": 1}
+    with db.session_scope() as session:
+        law = session.query(models.Law).get(law_id)
+        assert law.content_hash == "changed"
+        assert {item.doknr: item.id for item in law.contents} == \
+            {doknr: item_id for doknr, item_id in content_item_ids.items() if doknr != law_dict["contents"][6].doknr}
+        assert _api_model(law) == _api_model(models.Law.from_dict(updated_law_dict, "skaufg"))
+
+        assert bulk.update_law(session, law_id, "skaufg", updated_law_dict) == \
+            {"inserted": 0, "updated": 0, "moved": 0, "deleted": 0}
+        assert bulk.update_law(session, law_id, "skaufg", law_dict) == \
+            {"inserted": 1, "updated": 1, "moved": len(law_dict["contents"]) - 7, "deleted": 0}
+        session.expire_all()
+        assert _api_model(session.query(models.Law).get(law_id)) == _api_model(models.Law.from_dict(law_dict, "skaufg"))
@@ -0,0 +1,137 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from gadi import api_schemas, bulk, db, models
+from gadi.gesetze_im_internet import load_law_dict
+from gadi.gesetze_im_internet.download import LocalPathLocation
+from .utils import load_law_from_fixture, xml_fixtures_dir
+
+
+@pytest.fixture(autouse=True, scope="module")
+def init_db():
+    db.init_db()
+
+
+@pytest.fixture
+def session():
+    with db.session_scope() as session:
+        session.query(models.Law).delete()
+        yield session
+        session.rollback()
+
+
+def _insert_fixture_laws(session, *slugs):
+    location = LocalPathLocation(xml_fixtures_dir)
+    law_dicts = {slug: load_law_dict(location, slug) for slug in slugs}
+    bulk.insert_laws(session, law_dicts)
+    return law_dicts
+
+
+def _count(session, model):
+    return session.query(model).count()
+
+
+def test_delete_laws_by_doknr(session):
+    law_dicts = _insert_fixture_laws(session, "alg", "skaufg", "jfdg")
+
+    deleted = db.delete_laws_by_doknr(session, ["BJNR189100994", "BJNR055429995", "BJNR0000000"])
+
+    assert deleted == 2
+    assert [law.gii_slug for law in session.query(models.Law)] == ["jfdg"]
+    assert _count(session, models.ContentItem) == len(law_dicts["jfdg"]["contents"])
+    assert _count(session, models.Attachment) == 0
+    assert db.delete_laws_by_doknr(session, []) == 0
+
+
+def test_bulk_delete_laws_by_gii_slug(session):
+    law_dicts = _insert_fixture_laws(session, "alg", "skaufg", "jfdg")
+
+    deleted = db.bulk_delete_laws_by_gii_slug(session, ["alg", "skaufg", "removed"])
+
+    assert deleted == {
+        "laws": 2,
+        "content_items": len(law_dicts["alg"]["contents"]) + len(law_dicts["skaufg"]["contents"]),
+        "attachments": 1,
+    }
+    assert [law.gii_slug for law in session.query(models.Law)] == ["jfdg"]
+    assert _count(session, models.ContentItem) == len(law_dicts["jfdg"]["contents"])
+    assert _count(session, models.Attachment) == 0
+    assert db.bulk_delete_laws_by_gii_slug(session, []) == {"laws": 0, "content_items": 0, "attachments": 0}
+
+
+def _insert_with_abbreviations(session, abbreviations_by_gii_slug):
+    location = LocalPathLocation(xml_fixtures_dir)
+    law_dicts = {}
+    for fixture_slug, (gii_slug, abbreviation) in zip(["alg", "skaufg", "jfdg"], abbreviations_by_gii_slug.items()):
+        law_dicts[gii_slug] = dict(load_law_dict(location, fixture_slug), abbreviation=abbreviation)
+    bulk.insert_laws(session, law_dicts)
+
+
+def _slugs_by_gii_slug(session):
+    return {law.gii_slug: law.slug for law in session.query(models.Law)}
+
+
+def test_resolve_slug_conflicts(session):
+    _insert_with_abbreviations(session, {"aeg": "AEG", "aeg_1994": "AEG", "other": "AEG"})
+
+    renamed = db.resolve_slug_conflicts(session, ["aeg"], {"aeg": {"aeg_1994": "aeg", "aeg": "aeg_2"}})
+
+    assert renamed == 3
+    assert _slugs_by_gii_slug(session) == {"aeg": "aeg_2", "aeg_1994": "aeg", "other": "other"}
+    db.check_slugs_unique(session)
+    assert db.resolve_slug_conflicts(session) == 0
+
+
+def test_check_slugs_unique_fails_on_unresolved_conflicts(session):
+    _insert_with_abbreviations(session, {"x": "Y", "q": "Y", "r": "X"})
+    db.resolve_slug_conflicts(session, ["y"])
+
+    with pytest.raises(IntegrityError):
+        with session.begin_nested():
+            db.check_slugs_unique(session)
+
+    # The constraint is deferred again after rolling back the savepoint.
+    session.execute(models.Law.__table__.update().where(models.Law.gii_slug == "r").values(slug="q"))
+
+
+@contextmanager
+def _count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.get_engine(), "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.get_engine(), "before_cursor_execute", before_cursor_execute)
+
+
+def _all_law_api_models(session):
+    return [
+        api_schemas.LawAllFields.from_orm_model(law, include_contents=True)
+        for law in db.all_laws_with_contents(session, yield_per=1)
+    ]
+
+
+def test_all_laws_with_contents_uses_fixed_number_of_queries(session):
+    _insert_fixture_laws(session, "jfdg")
+    with _count_queries() as statements:
+        [jfdg] = _all_law_api_models(session)
+    query_count = len(statements)
+
+    _insert_fixture_laws(session, "alg", "skaufg")
+    session.expire_all()
+    with _count_queries() as statements:
+        law_api_models = _all_law_api_models(session)
+
+    assert query_count == len(statements) == 3
+    assert jfdg == api_schemas.LawAllFields.from_orm_model(load_law_from_fixture("jfdg"), include_contents=True)
+    assert law_api_models == [jfdg] + [
+        api_schemas.LawAllFields.from_orm_model(load_law_from_fixture(slug), include_contents=True)
+        for slug in ["alg", "skaufg"]
+    ]
@@ -0,0 +1,127 @@
+import os
+import zipfile
+
+import pytest
+
+from gadi import gesetze_im_internet
+from gadi.gesetze_im_internet import download
+from gadi.gesetze_im_internet.download import LocalPathLocation, ZipArchiveLocation, location_from_string
+from gadi.gesetze_im_internet.parsing import parse_law
+from .utils import FakeGii, xml_fixtures_dir, zip_fixture
+
+fixture_slugs = ["alg", "ifsg", "jfdg", "skaufg", "estg"]
+last_modified = 1600000000  # 2020-09-13
+
+
+@pytest.fixture
+def fake_gii():
+    fake = FakeGii({slug: (zip_fixture(slug), last_modified) for slug in fixture_slugs})
+    with fake.serve():
+        yield fake
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_download_laws(tmp_path, fake_gii, concurrency):
+    location = LocalPathLocation(str(tmp_path))
+    gesetze_im_internet.download_laws(location, concurrency=concurrency, toc_url=fake_gii.toc_url)
+
+    assert location.list_slugs_with_timestamps() == {slug: "20200913" for slug in fixture_slugs}
+    assert os.path.basename(location.xml_file_for("alg")) == "BJNR189100994.xml"
+    assert list(location.attachments("alg")) == ["bgbl1_2021_j0154-1_0010.jpg"]
+    assert location.attachments("alg") == LocalPathLocation(xml_fixtures_dir).attachments("alg")
+
+
+def test_download_laws_skips_unchanged_laws(tmp_path, fake_gii):
+    location = LocalPathLocation(str(tmp_path))
+    gesetze_im_internet.download_laws(location, concurrency=4, toc_url=fake_gii.toc_url)
+
+    jfdg_inode = os.stat(tmp_path / "jfdg").st_ino
+
+    fake_gii.requests.clear()
+    # Re-published with identical content.
+    fake_gii.laws["jfdg"] = (zip_fixture("jfdg"), last_modified + 2 * 86400)
+    del fake_gii.laws["alg"]
+    gesetze_im_internet.download_laws(location, concurrency=4, toc_url=fake_gii.toc_url)
+
+    assert sorted(fake_gii.requests) == [
+        ("GET", "/estg/xml.zip", 304),
+        ("GET", "/gii-toc.xml", 200),
+        ("GET", "/ifsg/xml.zip", 304),
+        ("GET", "/jfdg/xml.zip", 200),
+        ("GET", "/skaufg/xml.zip", 304),
+    ]
+    assert location.list_slugs_with_timestamps() == {
+        "ifsg": "20200913", "jfdg": "20200915", "skaufg": "20200913", "estg": "20200913"
+    }
+    assert os.stat(tmp_path / "jfdg").st_ino == jfdg_inode
+
+
+def test_download_laws_detects_same_day_changes(tmp_path, fake_gii):
+    location = LocalPathLocation(str(tmp_path))
+    gesetze_im_internet.download_laws(location, toc_url=fake_gii.toc_url)
+
+    fake_gii.requests.clear()
+    fake_gii.laws["ifsg"] = (zip_fixture("ifsg"), last_modified + 60)
+    gesetze_im_internet.download_laws(location, toc_url=fake_gii.toc_url)
+
+    assert ("GET", "/ifsg/xml.zip", 200) in fake_gii.requests
+
+
+def test_download_laws_with_legacy_timestamps(tmp_path, fake_gii):
+    location = LocalPathLocation(str(tmp_path))
+    gesetze_im_internet.download_laws(location, toc_url=fake_gii.toc_url)
+    os.remove(tmp_path / ".manifest.sqlite3")
+    for slug in fixture_slugs:
+        os.remove(tmp_path / slug / ".validators")
+
+    location = LocalPathLocation(str(tmp_path))
+    assert location.list_slugs_with_timestamps() == {slug: "20200913" for slug in fixture_slugs}
+
+    fake_gii.requests.clear()
+    gesetze_im_internet.download_laws(location, toc_url=fake_gii.toc_url)
+
+    assert {status for _, path, status in fake_gii.requests if path != "/gii-toc.xml"} == {304}
+    assert location.manifest.get("alg")["attachments"] == ["bgbl1_2021_j0154-1_0010.jpg"]
+
+
+def test_failed_download_keeps_previous_version(tmp_path, fake_gii):
+    location = LocalPathLocation(str(tmp_path))
+    gesetze_im_internet.download_laws(location, toc_url=fake_gii.toc_url)
+
+    fake_gii.laws["skaufg"] = (b"not a zip file", last_modified + 86400)
+    with pytest.raises(zipfile.BadZipFile):
+        gesetze_im_internet.download_laws(location, toc_url=fake_gii.toc_url)
+
+    assert os.path.basename(location.xml_file_for("skaufg")) == "BJNR055429995.xml"
+    assert sorted(os.listdir(tmp_path)) == sorted([".manifest.sqlite3"] + fixture_slugs)
+    assert location.list_slugs_with_timestamps()["skaufg"] == "20200913"
+
+
+def test_zip_archive_location(tmp_path, fake_gii):
+    location = location_from_string(f"zip://{tmp_path}")
+    assert isinstance(location, ZipArchiveLocation)
+    gesetze_im_internet.download_laws(location, concurrency=4, toc_url=fake_gii.toc_url)
+
+    assert sorted(os.listdir(tmp_path)) == sorted([".manifest.sqlite3"] + [f"{slug}.zip" for slug in fixture_slugs])
+    assert location.list_slugs_with_timestamps() == {slug: "20200913" for slug in fixture_slugs}
+    with location.xml_file_for("skaufg") as xml_file:
+        assert parse_law(xml_file)["doknr"] == "BJNR055429995"
+    assert location.attachments("alg") == LocalPathLocation(xml_fixtures_dir).attachments("alg")
+
+    local_location = LocalPathLocation(str(tmp_path / "extracted"))
+    gesetze_im_internet.download_laws(local_location, toc_url=fake_gii.toc_url)
+    for slug in fixture_slugs:
+        assert location.manifest.get(slug)["content_hash"] == local_location.manifest.get(slug)["content_hash"]
+
+    del fake_gii.laws["alg"]
+    gesetze_im_internet.download_laws(location, toc_url=fake_gii.toc_url)
+    assert not os.path.exists(tmp_path / "alg.zip")
+    assert "alg" not in location.list_slugs_with_timestamps()
+
+
+def test_location_without_store_law_cannot_be_created(tmp_path):
+    class IncompleteLocation(download._ManifestLocation):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteLocation(str(tmp_path))
@@ -0,0 +1,136 @@
+import os
+import shutil
+from unittest import mock
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from gadi import api_schemas, db, gesetze_im_internet, models
+from gadi.gesetze_im_internet import parse_cache
+from gadi.gesetze_im_internet.download import LocalPathLocation
+from .utils import load_law_from_fixture, xml_fixtures_dir
+
+
+@pytest.fixture(autouse=True, scope="module")
+def init_db():
+    db.init_db()
+
+
+@pytest.fixture
+def location(tmp_path):
+    shutil.copytree(xml_fixtures_dir, tmp_path / "gii")
+    return LocalPathLocation(str(tmp_path / "gii"))
+
+
+def _law_ids_by_gii_slug():
+    with db.session_scope() as session:
+        return {law.gii_slug: law.id for law in session.query(models.Law)}
+
+
+def test_ingest_skips_laws_with_unchanged_content(location, tmp_path):
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location)
+    ids_before = _law_ids_by_gii_slug()
+
+    with db.session_scope() as session:
+        law = db.find_law_by_slug(session, "jfdg")
+        assert law.content_hash == location.content_hash_for("jfdg")
+
+    xml_path = location.xml_file_for("jfdg")
+    with open(xml_path, "a") as f:
+        f.write("\n")
+
+    with mock.patch.object(gesetze_im_internet, "ingest_law", wraps=gesetze_im_internet.ingest_law) as ingest_law:
+        with db.session_scope() as session:
+            gesetze_im_internet.ingest_data_from_location(session, location)
+
+    assert [call.args[2] for call in ingest_law.call_args_list] == ["jfdg"]
+    # Updated in place
+    assert _law_ids_by_gii_slug() == ids_before
+    with db.session_scope() as session:
+        law = db.find_law_by_slug(session, "jfdg")
+        assert law.content_hash == location.content_hash_for("jfdg")
+
+
+@pytest.mark.parametrize("options", [{"workers": 2}, {"writers": 2, "batch_size": 2}])
+def test_ingest_in_processes(location, options):
+    with db.session_scope() as session:
+        session.query(models.Law).delete()
+
+    with db.session_scope() as session:
+        failures = gesetze_im_internet.ingest_data_from_location(session, location, **options)
+
+    assert failures == {}
+    with db.session_scope() as session:
+        for slug in ["alg", "estg", "ifsg", "jfdg", "skaufg"]:
+            law = session.query(models.Law).filter_by(gii_slug=slug).one()
+            assert api_schemas.LawAllFields.from_orm_model(law, include_contents=True) == \
+                api_schemas.LawAllFields.from_orm_model(load_law_from_fixture(slug), include_contents=True)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_ingest_skips_and_reports_failing_laws(location, workers):
+    with db.session_scope() as session:
+        session.query(models.Law).delete()
+
+    xml_path = location.xml_file_for("estg")
+    with open(xml_path, "rb") as f:
+        xml = f.read()
+    with open(xml_path, "wb") as f:
+        f.write(xml[:len(xml) // 2])
+
+    def ingest_law(session, location, gii_slug, *args):
+        law_id = real_ingest_law(session, location, gii_slug, *args)
+        if gii_slug == "ifsg":
+            raise Exception("Failed after writing")
+        return law_id
+
+    real_ingest_law = gesetze_im_internet.ingest_law
+    with mock.patch.object(gesetze_im_internet, "ingest_law", side_effect=ingest_law):
+        with db.session_scope() as session:
+            failures = gesetze_im_internet.ingest_data_from_location(session, location, workers=workers, batch_size=2)
+
+    assert sorted(failures) == ["estg", "ifsg"]
+    assert sorted(_law_ids_by_gii_slug()) == ["alg", "jfdg", "skaufg"]
+
+
+def test_ingest_deletes_removed_laws(location):
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location)
+
+    location.remove_law("alg")
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location)
+
+    assert sorted(_law_ids_by_gii_slug()) == ["estg", "ifsg", "jfdg", "skaufg"]
+
+
+def test_ingest_in_writer_processes_reports_failing_laws(location):
+    with db.session_scope() as session:
+        session.query(models.Law).delete()
+    with open(location.xml_file_for("estg"), "w") as f:
+        f.write("<dokumente>")
+
+    with db.session_scope() as session:
+        failures = gesetze_im_internet.ingest_data_from_location(session, location, writers=2, batch_size=2)
+
+    assert list(failures) == ["estg"]
+    assert sorted(_law_ids_by_gii_slug()) == ["alg", "ifsg", "jfdg", "skaufg"]
+
+
+def test_is_retryable():
+    class UniqueViolation(Exception):
+        pgcode = "23505"
+
+    assert gesetze_im_internet._is_retryable(UniqueViolation())
+    assert gesetze_im_internet._is_retryable(IntegrityError("INSERT", {}, UniqueViolation()))
+    assert not gesetze_im_internet._is_retryable(Exception("Parse error"))
+
+
+def test_ingest_law_reads_parse_cache_from_env(location, monkeypatch, tmp_path):
+    monkeypatch.setenv(parse_cache.CACHE_DIR_ENV, str(tmp_path / "cache"))
+
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_law(session, location, "jfdg")
+
+    assert os.listdir(tmp_path / "cache")
@@ -1,10 +1,14 @@
+import gzip
 import json
+import os
+from unittest import mock
 
 import pytest
 
-from gadi import api_schemas, db, gesetze_im_internet
+from gadi import api_schemas, db, gesetze_im_internet, models
+from gadi.gesetze_im_internet import parsing
 from gadi.gesetze_im_internet.download import location_from_string
-from .utils import load_example_json, xml_fixtures_dir
+from .utils import example_json_dir, load_example_json, load_law_from_fixture, xml_fixtures_dir
 
 example_law_slugs = ["alg", "ifsg", "jfdg", "skaufg", "estg"]
 
@@ -26,3 +30,102 @@ def test_examples(slug):
 
     expected = load_example_json(slug)["data"]
     assert parsed == expected
+
+
+def _read_output_files(dir_path):
+    files = {}
+    for path in sorted(dir_path.rglob("*.json*")):
+        with (gzip.open(path, "rt", encoding="utf-8") if path.suffix == ".gz" else open(path)) as f:
+            files[str(path.relative_to(dir_path))] = f.read()
+    return files
+
+
+def test_all_laws_json(tmp_path):
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location_from_string(xml_fixtures_dir))
+
+    with db.session_scope() as session:
+        gesetze_im_internet.write_all_law_json_files(session, str(tmp_path / "serial"))
+        gesetze_im_internet.write_all_law_json_files(session, str(tmp_path / "parallel"), workers=2)
+        laws = session.query(models.Law).order_by(models.Law.id)
+        expected = json.dumps({"data": [load_example_json(law.slug)["data"] for law in laws]}, indent=2) + "\n"
+
+    files = _read_output_files(tmp_path / "serial")
+    assert files["all_laws.json.gz"] == expected
+    for slug in example_law_slugs:
+        assert json.loads(files[f"laws/{slug}.json"]) == load_example_json(slug)
+    assert _read_output_files(tmp_path / "parallel") == files
+
+
+def test_partition():
+    assert gesetze_im_internet._partition([1, 2, 5, 7, 8], 2) == [[1, 2, 5], [7, 8]]
+    assert gesetze_im_internet._partition([1, 2], 4) == [[1], [2]]
+    assert gesetze_im_internet._partition([], 4) == []
+
+
+def _mtimes(dir_path):
+    return {str(path.relative_to(dir_path)): path.stat().st_mtime_ns for path in dir_path.rglob("*") if path.is_file()}
+
+
+def test_static_assets_are_generated_incrementally(tmp_path):
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location_from_string(xml_fixtures_dir))
+
+    output_dir = tmp_path / "incremental"
+    with db.session_scope() as session:
+        gesetze_im_internet.generate_static_assets(session, str(output_dir))
+    mtimes = _mtimes(output_dir)
+
+    with db.session_scope() as session:
+        gesetze_im_internet.generate_static_assets(session, str(output_dir))
+    assert _mtimes(output_dir) == mtimes
+
+    with db.session_scope() as session:
+        law = db.find_law_by_slug(session, "jfdg")
+        law.title_short = "Geändert"
+        law.content_hash = "changed"
+        db.bulk_delete_laws_by_gii_slug(session, ["alg"])
+    with db.session_scope() as session:
+        gesetze_im_internet.generate_static_assets(session, str(output_dir))
+        gesetze_im_internet.write_all_law_json_files(session, str(tmp_path / "full"))
+
+    changed = {path for path, mtime in _mtimes(output_dir).items() if mtimes.get(path) != mtime}
+    assert changed == {"__manifest.json", "all_laws.json.gz", "all_laws.tar.gz", "laws/__index.json", "laws/jfdg.json"}
+    assert not (output_dir / "laws" / "alg.json").exists()
+    assert _read_output_files(output_dir) == _read_output_files(tmp_path / "full")
+
+    # Restore the fixture laws for the other tests.
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location_from_string(xml_fixtures_dir))
+
+
+@pytest.mark.parametrize("module,version_name", [
+    (gesetze_im_internet, "EXPORT_VERSION"), (parsing, "PARSER_VERSION")
+])
+def test_version_bump_rewrites_all_law_files(module, version_name, tmp_path):
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location_from_string(xml_fixtures_dir))
+    with db.session_scope() as session:
+        gesetze_im_internet.write_all_law_json_files(session, str(tmp_path))
+    mtimes = _mtimes(tmp_path)
+
+    with mock.patch.object(module, version_name, getattr(module, version_name) + 1):
+        with db.session_scope() as session:
+            assert gesetze_im_internet.write_all_law_json_files(session, str(tmp_path))
+
+    new_mtimes = _mtimes(tmp_path)
+    assert sorted(mtimes) == sorted(new_mtimes)
+    assert [path for path, mtime in mtimes.items() if new_mtimes[path] == mtime] == []
+
+
+@pytest.mark.parametrize("slug", example_law_slugs)
+def test_fast_serialization_matches_models(slug, tmp_path):
+    law = load_law_from_fixture(slug)
+    gesetze_im_internet.write_law_json_file(law, str(tmp_path))
+
+    with open(tmp_path / f"{slug}.json") as f:
+        written = f.read()
+    response = api_schemas.LawResponse(data=api_schemas.LawAllFields.from_orm_model(law, include_contents=True))
+    assert written == response.json(indent=2) + "\n"
+    with open(os.path.join(example_json_dir, f"{slug}.json")) as f:
+        assert written == f.read()
@@ -0,0 +1,51 @@
+import os
+from unittest import mock
+
+from gadi.gesetze_im_internet import load_law_dict, parse_cache, parsing
+from gadi.gesetze_im_internet.download import LocalPathLocation
+from gadi.gesetze_im_internet.parse_cache import ParseCache, cache_key
+from .utils import xml_fixtures_dir
+
+
+def test_load_law_dict_uses_cache(tmp_path):
+    location = LocalPathLocation(xml_fixtures_dir)
+    cache = ParseCache(str(tmp_path))
+
+    law_dict = load_law_dict(location, "skaufg", cache)
+    with mock.patch("gadi.gesetze_im_internet.parsing.parse_law_streaming") as parse_mock:
+        cached_law_dict = load_law_dict(location, "skaufg", cache)
+
+    parse_mock.assert_not_called()
+    assert cached_law_dict == law_dict
+    assert cached_law_dict["contents"][3].parent_index == 2
+    assert load_law_dict(location, "skaufg") == law_dict
+
+
+def test_cache_key_depends_on_parser_version():
+    key = cache_key(b"<dokumente/>")
+    with mock.patch.object(parsing, "PARSER_VERSION", parsing.PARSER_VERSION + 1):
+        assert cache_key(b"<dokumente/>") != key
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path):
+    cache = ParseCache(str(tmp_path), max_size=2500)
+    value = {"data": os.urandom(1000)}
+
+    cache.put("a", value)
+    cache.put("b", value)
+    os.utime(tmp_path / "a.pickle.z", (0, 0))
+    os.utime(tmp_path / "b.pickle.z", (1, 1))
+    assert cache.get("a") == value  # bumps a
+    cache.put("c", value)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == value
+    assert cache.get("c") == value
+
+
+def test_cache_is_opt_in(monkeypatch, tmp_path):
+    monkeypatch.delenv(parse_cache.CACHE_DIR_ENV, raising=False)
+    assert parse_cache.cache_from_env() is None
+
+    monkeypatch.setenv(parse_cache.CACHE_DIR_ENV, str(tmp_path))
+    assert parse_cache.cache_from_env().cache_dir == str(tmp_path)
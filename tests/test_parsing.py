@@ -1,6 +1,12 @@
+import io
+import os
 from unittest import mock
 
-from gadi.gesetze_im_internet.parsing import parse_law
+import pytest
+from lxml import etree
+
+from gadi.gesetze_im_internet.parsing import NormOrderError, inner_xml, parse_law, parse_law_streaming
+from .utils import xml_fixtures_dir
 
 
 def test_parser():
@@ -35,21 +41,21 @@ def test_parser():
     assert len(law["contents"]) == 9
 
     item = law["contents"][0]
-    assert item["item_type"] == "article"
-    assert item["doknr"] == "BJNR055429995BJNE000600305"
-    assert item["name"] == "Eingangsformel"
-    assert item["title"] is None
-    assert item["body"] == "<P>Der Bundestag hat mit Zustimmung des Bundesrates das folgende Gesetz beschlossen:</P>"
-    assert item["footnotes"] is None
-    assert item["documentary_footnotes"] is None
-    assert item["parent"] is None
+    assert item.item_type == "article"
+    assert item.doknr == "BJNR055429995BJNE000600305"
+    assert item.name == "Eingangsformel"
+    assert item.title is None
+    assert item.body == "<P>Der Bundestag hat mit Zustimmung des Bundesrates das folgende Gesetz beschlossen:</P>"
+    assert item.footnotes is None
+    assert item.documentary_footnotes is None
+    assert item.parent_index is None
 
     item = law["contents"][1]
-    assert item["item_type"] == "article"
-    assert item["doknr"] == "BJNR055429995BJNG000100305"
-    assert item["name"] == "Art 1"
-    assert item["title"] is None
-    assert item["body"] == (
+    assert item.item_type == "article"
+    assert item.doknr == "BJNR055429995BJNG000100305"
+    assert item.name == "Art 1"
+    assert item.title is None
+    assert item.body == (
         "<P>(1) Die Bundesregierung wird ermächtigt, Vereinbarungen mit ausländischen Staaten "
         "über Einreise und vorübergehenden Aufenthalt ihrer Streitkräfte in der Bundesrepublik "
         "Deutschland für Übungen, Durchreise auf dem Landwege und Ausbildung von Einheiten durch "
@@ -58,44 +64,44 @@ def test_parser():
         "Bundeswehr den Aufenthalt in ihrem Hoheitsgebiet gestatten.</P><P>(3) Die betroffenen "
         "Länder werden beteiligt.</P>"
     )
-    assert item["footnotes"] is None
-    assert item["documentary_footnotes"] is None
-    assert item["parent"] is None
+    assert item.footnotes is None
+    assert item.documentary_footnotes is None
+    assert item.parent_index is None
 
     item = law["contents"][2]
-    assert item["item_type"] == "heading_article"
-    assert item["doknr"] == "BJNR055429995BJNG000200305"
-    assert item["name"] == "Art 2"
-    assert item["title"] is None
-    assert item["body"] == (
+    assert item.item_type == "heading_article"
+    assert item.doknr == "BJNR055429995BJNG000200305"
+    assert item.name == "Art 2"
+    assert item.title is None
+    assert item.body == (
         "<P>In die Vereinbarungen werden, soweit nach ihrem Gegenstand und Zweck erforderlich, "
         "Regelungen mit folgendem Inhalt aufgenommen.</P>"
     )
-    assert item["footnotes"] is None
-    assert item["documentary_footnotes"] is None
-    assert item["parent"] is None
+    assert item.footnotes is None
+    assert item.documentary_footnotes is None
+    assert item.parent_index is None
 
     item = law["contents"][3]
-    assert item["item_type"] == "article"
-    assert item["doknr"] == "BJNR055429995BJNE000700305"
-    assert item["name"] == "§ 1"
-    assert item["title"] == "Allgemeine Voraussetzungen"
-    assert item["body"] == (
+    assert item.item_type == "article"
+    assert item.doknr == "BJNR055429995BJNE000700305"
+    assert item.name == "§ 1"
+    assert item.title == "Allgemeine Voraussetzungen"
+    assert item.body == (
         "<P>(1) Für Einreise und Aufenthalt bestimmen sich die Rechte und Pflichten der "
         "ausländischen Streitkräfte und ihrer Mitglieder nach den deutschen Gesetzen und "
         "Rechtsvorschriften.</P><P>(2) In der Vereinbarung sind die Rahmenbedingungen für den "
         "Aufenthalt der ausländischen Streitkräfte nach Art, Umfang und Dauer festzulegen.</P>"
     )
-    assert item["footnotes"] is None
-    assert item["documentary_footnotes"] is None
-    assert item["parent"] == law["contents"][2]
+    assert item.footnotes is None
+    assert item.documentary_footnotes is None
+    assert item.parent_index == 2
 
     item = law["contents"][4]
-    assert item["item_type"] == "article"
-    assert item["doknr"] == "BJNR055429995BJNE000801310"
-    assert item["name"] == "§ 2"
-    assert item["title"] == "Grenzübertritt, Einreise"
-    assert item["body"] == (
+    assert item.item_type == "article"
+    assert item.doknr == "BJNR055429995BJNE000801310"
+    assert item.name == "§ 2"
+    assert item.title == "Grenzübertritt, Einreise"
+    assert item.body == (
         "<P>(1) Ausländische Streitkräfte und deren Mitglieder sind im Rahmen dieses Gesetzes "
         "und der ausländerrechtlichen Vorschriften berechtigt, mit Land-, Wasser- und "
         "Luftfahrzeugen in die Bundesrepublik Deutschland einzureisen und sich in oder über "
@@ -123,59 +129,120 @@ def test_parser():
         "nachzukommen und die Aufnahme des betreffenden Mitgliedes im eigenen Hoheitsgebiet zu "
         "gewährleisten haben. Im übrigen bleiben die Bestimmungen des Aufenthaltsgesetzes unberührt.</P>"
     )
-    assert item["footnotes"] is None
-    assert item["documentary_footnotes"] is None
-    assert item["parent"] == law["contents"][2]
+    assert item.footnotes is None
+    assert item.documentary_footnotes is None
+    assert item.parent_index == 2
 
     item = law["contents"][5]
-    assert item["item_type"] == "heading"
-    assert item["doknr"] == "BJNR055429995BJNG000300305"
-    assert item["name"] == "Art 3"
-    assert item["title"] is None
-    assert item["parent"] is None
+    assert item.item_type == "heading"
+    assert item.doknr == "BJNR055429995BJNG000300305"
+    assert item.name == "Art 3"
+    assert item.title is None
+    assert item.parent_index is None
 
     item = law["contents"][6]
-    assert item["item_type"] == "article"
-    assert item["doknr"] == "BJNR055429995BJNE002801311"
-    assert item["name"] == "§ 1"
-    assert item["title"] is None
-    assert item["body"] == (
+    assert item.item_type == "article"
+    assert item.doknr == "BJNR055429995BJNE002801311"
+    assert item.name == "§ 1"
+    assert item.title is None
+    assert item.body == (
         "<P>Das Bundesministerium der Verteidigung erläßt im Einvernehmen mit dem Bundesministerium des "
         "Innern, für Bau und Heimat allgemeine Verwaltungsvorschriften zur Ausführung des Artikels 2 § 5 "
         "über Besitz und Führen von Schußwaffen der diesem Gesetz unterfallenden ausländischen "
         "Militärangehörigen.</P>"
     )
-    assert item["footnotes"] is None
-    assert item["documentary_footnotes"] is None
-    assert item["parent"] == law["contents"][5]
+    assert item.footnotes is None
+    assert item.documentary_footnotes is None
+    assert item.parent_index == 5
 
     item = law["contents"][7]
-    assert item["item_type"] == "article"
-    assert item["doknr"] == "BJNR055429995BJNE002900305"
-    assert item["name"] == "§ 2"
-    assert item["title"] is None
-    assert item["body"] == (
+    assert item.item_type == "article"
+    assert item.doknr == "BJNR055429995BJNE002900305"
+    assert item.name == "§ 2"
+    assert item.title is None
+    assert item.body == (
         "<P>Der Verzicht auf die Ausübung der deutschen Gerichtsbarkeit gemäß Artikel 2 § 7 Abs. 2 "
         "wird von der Staatsanwaltschaft erklärt.</P>"
     )
-    assert item["footnotes"] is None
-    assert item["documentary_footnotes"] is None
-    assert item["parent"] == law["contents"][5]
+    assert item.footnotes is None
+    assert item.documentary_footnotes is None
+    assert item.parent_index == 5
 
     item = law["contents"][8]
-    assert item["item_type"] == "article"
-    assert item["doknr"] == "BJNR055429995BJNG000400305"
-    assert item["name"] == "Art 4"
-    assert item["title"] is None
-    assert item["body"] == (
+    assert item.item_type == "article"
+    assert item.doknr == "BJNR055429995BJNG000400305"
+    assert item.name == "Art 4"
+    assert item.title is None
+    assert item.body == (
         "<P>Dieses Gesetz findet keine Anwendung auf <ABWFORMAT typ=\"A\" />Militärattaches eines "
         "ausländischen Staates in der Bundesrepublik Deutschland, die Mitglieder ihrer Stäbe "
         "sowie andere Militärpersonen, die in der Bundesrepublik Deutschland einen diplomatischen "
         "oder konsularischen Status haben.</P>"
     )
-    assert item["footnotes"] is None
-    assert item["documentary_footnotes"] is None
-    assert item["parent"] is None
+    assert item.footnotes is None
+    assert item.documentary_footnotes is None
+    assert item.parent_index is None
+
+
+def test_inner_xml_matches_elementtree_serialization():
+    assert inner_xml(etree.fromstring('<P>a &amp; b<BR/>c &amp; d</P>')) == 'a & b<BR />c &amp; d'
+    assert inner_xml(etree.fromstring(
+        '<P><!-- x -->a<B x="1 &gt; 0">b<?pi?>c</B><pre xml:space="preserve"/></P>'
+    )) == 'a<B x="1 &gt; 0">bc</B><pre xml:space="preserve" />'
+    assert inner_xml(etree.fromstring('<Content>a<B>b</B>&#13;c</Content>')) == 'a<B>b</B>\rc'
+
+
+@pytest.mark.parametrize("slug", sorted(os.listdir(xml_fixtures_dir)))
+def test_streaming_parser_matches_parser(slug):
+    xml_dir = os.path.join(xml_fixtures_dir, slug)
+    xml_path = os.path.join(xml_dir, next(f for f in os.listdir(xml_dir) if f.endswith(".xml")))
+
+    law = parse_law_streaming(xml_path)
+    law["contents"] = list(law["contents"])
+
+    assert law == parse_law(xml_path)
+
+
+def _norm(doknr, code=None, body=None):
+    section = code and f"<gliederungseinheit><gliederungskennzahl>{code}</gliederungskennzahl>" \
+        f"<gliederungsbez>{doknr}</gliederungsbez></gliederungseinheit>"
+    text = body and f"<textdaten><text><Content>{body}</Content></text></textdaten>"
+    return f'<norm doknr="{doknr}"><metadaten><enbez>{doknr}</enbez>{section or ""}</metadaten>{text or ""}</norm>'
+
+
+def _law_xml(*body_norms):
+    header = (
+        '<norm builddate="20200101" doknr="BJNR1"><metadaten><jurabk>X</jurabk>'
+        "<ausfertigung-datum>2000-01-01</ausfertigung-datum><langue>X</langue></metadaten></norm>"
+    )
+    return io.BytesIO(f"<dokumente>{header}{''.join(body_norms)}</dokumente>".encode())
+
+
+def test_streaming_parser_holds_back_undecided_heading_articles():
+    contents = parse_law_streaming(_law_xml(
+        _norm("BJNR1NG1", code="010", body="b"),
+        _norm("BJNR1NG2", code="020", body="b"),
+        _norm("BJNR1NE1", code="020"),
+        _norm("BJNR1NG3", code="030", body="b"),
+    ))["contents"]
+
+    assert next(contents).item_type == "article"  # NG1 has no children once NG2 starts
+    assert next(contents).item_type == "heading_article"
+    assert next(contents).parent_index == 1
+    assert next(contents).item_type == "article"
+    assert next(contents, None) is None
+
+
+def test_streaming_parser_rejects_out_of_order_norms():
+    xml = _law_xml(
+        _norm("BJNR1NG1", code="010", body="b"),
+        _norm("BJNR1NG2", code="020"),
+        _norm("BJNR1NE1", code="010"),
+    )
+
+    with pytest.raises(NormOrderError):
+        list(parse_law_streaming(xml)["contents"])
+    assert parse_law(io.BytesIO(xml.getvalue()))["contents"][0].item_type == "heading_article"
 
 
 XML_DATA = """\
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+repo_dir = os.path.join(os.path.dirname(__file__), "..")
+
+HEAVY_MODULES = ["sqlalchemy", "psycopg2", "pydantic", "lxml"]
+
+
+def _import(module, env=None):
+    """Import `module` in a fresh interpreter. :return: The names of all modules loaded afterwards."""
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print('\\n'.join(sys.modules))"],
+        cwd=repo_dir, env=dict(os.environ, **(env or {})), capture_output=True, text=True, check=True
+    )
+    return set(result.stdout.splitlines())
+
+
+@pytest.mark.parametrize("module", ["tasks", "gadi.gesetze_im_internet"])
+def test_import_does_not_load_heavy_modules(module):
+    loaded_modules = _import(module)
+
+    assert module in loaded_modules
+    assert [name for name in HEAVY_MODULES if name in loaded_modules] == []
+
+
+def test_db_import_does_not_create_engine():
+    _import("gadi.db", env={"DB_URI": "nodriver://"})
@@ -1,8 +1,17 @@
+from contextlib import contextmanager
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
 import json
 import os
+import threading
+import time
+import zipfile
 
 from gadi import models
-from gadi.gesetze_im_internet import download, parsing
+from gadi.gesetze_im_internet import download
+from gadi.gesetze_im_internet.parsing import parse_law
 
 example_json_dir = os.path.join(os.path.dirname(__file__), "..", "example_json")
 xml_fixtures_dir = os.path.join(os.path.dirname(__file__), "fixtures", "gii_xml")
@@ -14,9 +23,120 @@ def load_example_json(slug):
 
 
 def load_law_from_fixture(slug):
+    """The fixture law parsed with parse_law, bypassing the parse cache and the streaming parser."""
     location = download.LocalPathLocation(xml_fixtures_dir)
-    xml_filename = location.xml_file_for(slug)
-    law_dict = parsing.parse_law(xml_filename)
+    law_dict = parse_law(location.xml_file_for(slug))
     law_dict["attachments"] = location.attachments(slug)
+    law_dict["content_hash"] = location.content_hash_for(slug)
     law = models.Law.from_dict(law_dict, slug)
     return law
+
+
+def zip_fixture(slug):
+    """Pack a fixture law directory the way gesetze-im-internet.de serves it (as xml.zip)."""
+    law_dir = os.path.join(xml_fixtures_dir, slug)
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for filename in sorted(os.listdir(law_dir)):
+            if not filename.startswith("."):
+                zf.write(os.path.join(law_dir, filename), filename)
+    return buffer.getvalue()
+
+
+class FakeGii:
+    """
+    Local stand-in for gesetze-im-internet.de serving gii-toc.xml and one
+    xml.zip per law. Laws map slug -> (zip bytes, last modified unix time).
+    """
+
+    def __init__(self, laws, latency=0):
+        self.laws = laws
+        self.latency = latency
+        self.requests = []
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def toc_url(self):
+        return self.base_url + "/gii-toc.xml"
+
+    def toc(self):
+        items = "".join(
+            f"<item><title>{slug}</title><link>{self.base_url}/{slug}/xml.zip</link></item>"
+            for slug in sorted(self.laws)
+        )
+        return f'<?xml version="1.0" encoding="utf-8"?><items>{items}</items>'.encode("utf-8")
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _respond(self, include_body):
+                time.sleep(fake.latency)
+
+                if self.path == "/gii-toc.xml":
+                    body, headers = fake.toc(), {}
+                else:
+                    slug = self.path.split("/")[1]
+                    if slug not in fake.laws:
+                        fake.requests.append((self.command, self.path, 404))
+                        self.send_error(404)
+                        return
+                    body, last_modified = fake.laws[slug]
+                    headers = {
+                        "Last-Modified": formatdate(last_modified, usegmt=True),
+                        # Like Apache's default, the ETag changes with the modification time.
+                        "ETag": '"%s-%x"' % (hashlib.md5(body).hexdigest(), last_modified),
+                    }
+                    if self._not_modified(headers["ETag"], last_modified):
+                        fake.requests.append((self.command, self.path, 304))
+                        self.send_response(304)
+                        self.send_header("ETag", headers["ETag"])
+                        self.end_headers()
+                        return
+
+                fake.requests.append((self.command, self.path, 200))
+                self.send_response(200)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if include_body:
+                    self.wfile.write(body)
+
+            def _not_modified(self, etag, last_modified):
+                if_none_match = self.headers.get("If-None-Match")
+                if if_none_match:
+                    return if_none_match == etag
+                if_modified_since = self.headers.get("If-Modified-Since")
+                if if_modified_since:
+                    return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+                return False
+
+            def do_GET(self):
+                self._respond(include_body=True)
+
+            def do_HEAD(self):
+                self._respond(include_body=False)
+
+        return Handler
+
+    @contextmanager
+    def serve(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            self._server.shutdown()
+            self._server.server_close()